@@ -0,0 +1,512 @@
+import os
+import pandas as pd
+import numpy as np
+from collections import namedtuple
+
+
+"""
+This file contains the functions that are shared between 'generate_ancestor_file.py' (which generates the
+ancestor files) and 'main.py' (which plots the ancestors in time on a Geo map using Bokeh).
+
+Instead of repeating every person once for every year (persons x years rows), the ancestors are stored as
+intervals: one row per person with the year of birth and the year of death ('exported_ancestor_intervals.csv').
+From these intervals a per-year index is built, which holds for every year the rows of the persons that are
+alive in that year, together with their glyph size. The map uses it to filter and size the persons of the selected
+year in the static build, and to build the clusters (see below) on the Bokeh server.
+
+When running on the Bokeh server, the prepared ancestors are loaded only once per process and shared by all
+sessions (see get_shared_ancestors and server_lifecycle.py).
+
+Next to the interval CSV file, a columnar binary file ('exported_ancestor_intervals.npz') is generated with proper
+dtypes (categories for places and side, int16 years, float32 mercator coordinates, dates). If present and up to
+date, this file is loaded instead of parsing the CSV file (see load_ancestor_intervals).
+
+To keep the number of glyphs on the map bounded, the alive persons are aggregated into clusters: per year and per
+zoom level, all persons born in the same cell of a grid on the mercator coordinates form one cluster per side
+(see build_cluster_level). The grid cells are larger when the map is zoomed out.
+
+The optional migration layer of the map draws a line from the place of birth to the place of death of the alive
+persons. Its per-year index (see build_migration_index) is precomputed by 'generate_ancestor_file.py' into a
+separate file ('exported_ancestor_migrations.npz'), which is only loaded once the layer is turned on (see
+get_shared_migrations).
+"""
+
+
+# Generated interval file, and the last year that can be selected on the map
+INTERVALS_FILE_NAME = 'exported_ancestor_intervals.csv'
+# Input files of 'generate_ancestor_file.py'; the binary interval file is only used if not older than these
+SOURCE_FILE_NAMES = ['maps_ancestors.csv', 'maps_cities.csv']
+LAST_YEAR_OF_REFERENCE = 1940
+# Generated per-year index of the migration layer
+MIGRATIONS_FILE_NAME = 'exported_ancestor_migrations.npz'
+
+# Zoom levels of the clusters: the size of the grid cells in mercator meters (from 1 km up to 512 km), and the
+# number of grid cells that should fit across the width or height of the map (whichever is larger)
+CLUSTER_CELL_SIZES = [1000 * 2 ** level for level in range(10)]
+CLUSTER_CELLS_ACROSS = 60
+# Only the clusters in the visible part of the map plus a margin on every side (as a fraction of the width and
+# height of the map) are sent to the browser, so panning a bit doesn't need new clusters (see cluster_extent)
+CLUSTER_EXTENT_MARGIN = 0.5
+# Maximum number of names shown in the tooltip of a cluster
+CLUSTER_MAX_NAMES = 5
+# Glyph size of the clusters (see cluster_glyph_sizes): up to this number of persons the same as the glyph size of
+# the persons themselves, above it growing with the square root of the number of persons, up to the maximum size
+CLUSTER_LINEAR_GLYPH_PERSONS = 20
+CLUSTER_MAX_GLYPH_SIZE = 50
+
+
+# Columns of the interval file; one row per person
+INTERVAL_COLUMNS = ['Persoon', 'Achternaam', 'Voornaam', 'Voorvoegsel', 'date_of_birth', 'place_of_birth',
+                    'date_of_death', 'place_of_death', 'mothers_side', 'mercator_x_birth', 'mercator_y_birth',
+                    'mercator_x_death', 'mercator_y_death', 'year_of_birth', 'year_of_death']
+INTERVAL_DTYPES = {'Persoon': int, 'Achternaam': str, 'Voornaam': str, 'Voorvoegsel': str, 'date_of_birth': object,
+                   'place_of_birth': str, 'date_of_death': object, 'place_of_death': str, 'mothers_side': str,
+                   'mercator_x_birth': float, 'mercator_y_birth': float, 'mercator_x_death': float,
+                   'mercator_y_death': float, 'year_of_birth': int, 'year_of_death': int}
+
+# Dtypes of the columns in the binary interval file. Text columns are stored as one UTF-8 encoded text plus the 
+# offsets of the values in it (see encode_texts), and categorical columns as codes plus categories.
+STRING_COLUMNS = ['Achternaam', 'Voornaam', 'Voorvoegsel']
+CATEGORICAL_COLUMNS = ['place_of_birth', 'place_of_death', 'mothers_side']
+BINARY_DTYPES = {'Persoon': np.int32, 'date_of_birth': 'datetime64[D]', 'date_of_death': 'datetime64[D]',
+                 'mercator_x_birth': np.float32, 'mercator_y_birth': np.float32, 'mercator_x_death': np.float32,
+                 'mercator_y_death': np.float32, 'year_of_birth': np.int16, 'year_of_death': np.int16}
+
+
+def count_alive_persons_per_birthplace(df_persons, first_year, nr_of_years):
+    """
+    Determine for every place of birth and every year how many persons born in that place were alive.
+    Instead of counting the alive persons for every row (which is very slow), a 'sweep line' is used: every
+    person adds +1 to its place of birth in the year of birth and -1 in the year after the year of death. The
+    cumulative sum over the years then gives the number of alive persons per place of birth and year.
+
+    Returns a tuple (place_codes, alive_counts): place_codes holds for every person in df_persons the row in
+    alive_counts (-1 if the place of birth is unknown) and alive_counts is a numpy array with shape
+    (nr of places of birth, nr_of_years).
+    """
+    # An unknown place of birth is either NaN or, once the dataframe is cleaned up, an empty string
+    place_codes, places = pd.factorize(df_persons['place_of_birth'].replace('', np.nan))
+    birth_index = df_persons['year_of_birth'].to_numpy() - first_year
+    death_index = df_persons['year_of_death'].to_numpy() - first_year + 1
+
+    # Only persons with a known place of birth and that were alive at least one year in the range count. Note
+    # that persons with an unknown date of birth (2199-12-31) are never alive, as year of birth > year of death.
+    counted = (place_codes >= 0) & (birth_index < death_index)
+    birth_index = np.clip(birth_index[counted], 0, nr_of_years)
+    death_index = np.clip(death_index[counted], 0, nr_of_years)
+
+    alive_deltas = np.zeros((len(places), nr_of_years + 1), dtype=np.int64)
+    np.add.at(alive_deltas, (place_codes[counted], birth_index), 1)
+    np.add.at(alive_deltas, (place_codes[counted], death_index), -1)
+    alive_counts = np.cumsum(alive_deltas, axis=1)[:, :nr_of_years]
+    return place_codes, alive_counts
+
+
+def to_dates(date_texts):
+    """
+    Convert a column with dates as text ('YYYY-MM-DD') to a date type column. Unlike pd.to_datetime, which stores
+    dates in nanoseconds, this also supports dates before 1677, as the dates are stored in seconds.
+    """
+    dates = date_texts.fillna('NaT').to_numpy(dtype='datetime64[D]')
+    return pd.Series(dates.astype('datetime64[s]'), index=date_texts.index, name=date_texts.name)
+
+
+def binary_file_name(file_name):
+    """
+    Return the name of the binary interval file that belongs to the given interval CSV file
+    """
+    return os.path.splitext(file_name)[0] + '.npz'
+
+
+def encode_texts(texts):
+    """
+    Encode a list of texts as one UTF-8 encoded numpy array plus the (character) offsets of the texts in it. This
+    is much faster to decode than a numpy array of strings.
+    """
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(text) for text in texts])
+    return np.frombuffer(''.join(texts).encode('utf-8'), dtype=np.uint8), offsets
+
+
+def decode_texts(encoded_text, offsets):
+    """
+    Decode the texts as encoded by encode_texts into a numpy array of objects (str)
+    """
+    text = encoded_text.tobytes().decode('utf-8')
+    offsets = offsets.tolist()
+    texts = np.empty(len(offsets) - 1, dtype=object)
+    texts[:] = [text[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+    return texts
+
+
+def save_ancestor_intervals_binary(df_intervals, file_name):
+    """
+    Write the intervals (with date fields as date type fields) to a columnar binary file, see BINARY_DTYPES
+    """
+    columns = {}
+    for column_name in STRING_COLUMNS:
+        columns[column_name + '.text'], columns[column_name + '.offsets'] = encode_texts(
+            df_intervals[column_name].fillna('').astype(str).tolist())
+    for column_name in CATEGORICAL_COLUMNS:
+        codes, categories = pd.factorize(df_intervals[column_name].fillna(''))
+        # int16 codes are enough for the places of a family tree, but not for any number of places
+        code_dtype = np.int16 if len(categories) <= np.iinfo(np.int16).max else np.int32
+        columns[column_name + '.codes'] = codes.astype(code_dtype)
+        columns[column_name + '.text'], columns[column_name + '.offsets'] = encode_texts(categories.astype(str).tolist())
+    for column_name, dtype in BINARY_DTYPES.items():
+        columns[column_name] = df_intervals[column_name].to_numpy().astype(dtype)
+    with open(file_name, 'wb') as binary_file:
+        np.savez(binary_file, **columns)
+
+
+def is_binary_file_up_to_date(binary_file, file_name):
+    """
+    The binary file can be used if it exists, and is not older than the interval CSV file and its source files
+    """
+    if not os.path.exists(binary_file):
+        return False
+    source_files = [source_file for source_file in [file_name] + SOURCE_FILE_NAMES if os.path.exists(source_file)]
+    return all(os.path.getmtime(binary_file) >= os.path.getmtime(source_file) for source_file in source_files)
+
+
+def read_ancestor_intervals_binary(binary_file):
+    """
+    Read the binary interval file into a dataframe with the columns in the same order as the CSV file. Note that
+    an .npz file can't be memory-mapped; the arrays are read directly into memory without any parsing.
+    The categorical columns are read as categoricals (codes plus categories, as stored), and the mercator 
+    coordinates as float64, the same as when the CSV file is read.
+    """
+    with np.load(binary_file) as columns:
+        df_columns = {column_name: decode_texts(columns[column_name + '.text'], columns[column_name + '.offsets'])
+                      for column_name in STRING_COLUMNS}
+        for column_name in CATEGORICAL_COLUMNS:
+            categories = decode_texts(columns[column_name + '.text'], columns[column_name + '.offsets'])
+            df_columns[column_name] = pd.Categorical.from_codes(columns[column_name + '.codes'], categories)
+        for column_name in BINARY_DTYPES:
+            df_columns[column_name] = columns[column_name]
+    for column_name in ['date_of_birth', 'date_of_death']:
+        df_columns[column_name] = df_columns[column_name].astype('datetime64[s]')
+    for column_name in ['mercator_x_birth', 'mercator_y_birth', 'mercator_x_death', 'mercator_y_death']:
+        df_columns[column_name] = df_columns[column_name].astype(np.float64)
+    df_intervals = pd.DataFrame(df_columns, columns=INTERVAL_COLUMNS)
+    return df_intervals
+
+
+def load_ancestor_intervals(file_name):
+    """
+    Read the interval file (one row per person) as generated via 'generate_ancestor_file.py' and prepare it
+    for plotting: date fields as date type fields, NaN values in text fields replaced with an empty string and
+    the places and side as categoricals. The binary interval file is used instead of the CSV file, if it is up to 
+    date.
+    """
+    binary_file = binary_file_name(file_name)
+    if is_binary_file_up_to_date(binary_file, file_name):
+        return read_ancestor_intervals_binary(binary_file)
+
+    df_intervals = pd.read_csv(file_name, sep=',', dtype=INTERVAL_DTYPES)
+
+    # Set date fields as date type fields
+    df_intervals['date_of_birth'] = to_dates(df_intervals['date_of_birth'])
+    df_intervals['date_of_death'] = to_dates(df_intervals['date_of_death'])
+
+    # Clean up dataframe, replacing all NaN values in text fields with an empty string
+    text_columns = STRING_COLUMNS + CATEGORICAL_COLUMNS
+    df_intervals[text_columns] = df_intervals[text_columns].replace(np.nan, '', regex=True)
+    df_intervals[CATEGORICAL_COLUMNS] = df_intervals[CATEGORICAL_COLUMNS].astype('category')
+    return df_intervals
+
+
+def build_year_index(df_intervals, first_year, last_year):
+    """
+    Build the per-year index: a dict with for every year from first_year up to and including last_year a tuple
+    (rows, glyph_sizes). Rows are the positions in df_intervals of the persons that were alive in that year (and
+    have a known place of birth); glyph_sizes hold the glyph size of these persons in that year, based on the
+    number of alive persons born in the same place.
+    """
+    nr_of_years = last_year - first_year + 1
+    place_codes, alive_counts = count_alive_persons_per_birthplace(df_intervals, first_year, nr_of_years)
+    years_of_birth = df_intervals['year_of_birth'].to_numpy()
+    years_of_death = df_intervals['year_of_death'].to_numpy()
+
+    year_index = {}
+    for year_offset, year in enumerate(range(first_year, last_year + 1)):
+        rows = np.flatnonzero((place_codes >= 0) & (years_of_birth <= year) & (years_of_death >= year))
+        glyph_sizes = alive_counts[place_codes[rows], year_offset] + 5
+        year_index[year] = (rows, glyph_sizes)
+    return year_index
+
+
+# The clusters of one zoom level: frames holds per year the data of the clusters of that year, ready to be used as
+# data of a ColumnDataSource (see cluster_frame_data), and positions per year the mercator x and y coordinates of
+# these clusters as numpy arrays (to select the clusters within an extent of the map)
+ClusterLevel = namedtuple('ClusterLevel', ['cell_size', 'frames', 'positions'])
+
+
+def cluster_glyph_sizes(nr_of_persons):
+    """
+    Return the glyph sizes of clusters with the given numbers of persons (a numpy array). Small clusters get the
+    same size as the persons themselves (the number of persons + 5), so on the lowest zoom levels a cluster of the
+    persons born in one place looks the same as these persons. Larger clusters grow with the square root of the
+    number of persons and are capped, so a cluster of thousands of persons doesn't cover the whole map.
+    """
+    linear_sizes = nr_of_persons + 5
+    square_root_sizes = 5 + CLUSTER_LINEAR_GLYPH_PERSONS * np.sqrt(nr_of_persons / CLUSTER_LINEAR_GLYPH_PERSONS)
+    glyph_sizes = np.where(nr_of_persons <= CLUSTER_LINEAR_GLYPH_PERSONS, linear_sizes, np.round(square_root_sizes))
+    return np.minimum(glyph_sizes, CLUSTER_MAX_GLYPH_SIZE).astype(np.int64)
+
+
+def build_cluster_level(df_intervals, year_index, cell_size):
+    """
+    Aggregate for every year the alive persons (see build_year_index) into clusters: all persons born in the same 
+    grid cell of cell_size by cell_size (mercator) meters and on the same side form one cluster. All clusters of a 
+    cell are placed at the mean location of the persons in the cell, with a glyph size based on the number of
+    persons in the cell (see cluster_glyph_sizes). When the cells are small enough, a cell contains only one place 
+    of birth, so the glyph size is the same as the glyph size of the persons themselves.
+    """
+    years = np.concatenate([np.full(len(rows), year) for year, (rows, glyph_sizes) in year_index.items()])
+    rows = np.concatenate([rows for rows, glyph_sizes in year_index.values()])
+    mercator_x = df_intervals['mercator_x_birth'].to_numpy(dtype=float)[rows]
+    mercator_y = df_intervals['mercator_y_birth'].to_numpy(dtype=float)[rows]
+
+    # Persons born in a place without a geo location can't be shown on the map
+    located = ~(np.isnan(mercator_x) | np.isnan(mercator_y))
+    df_persons = pd.DataFrame({'year': years[located], 'row': rows[located], 
+                               'mercator_x': mercator_x[located], 'mercator_y': mercator_y[located],
+                               'cell_x': np.floor(mercator_x[located] / cell_size).astype(np.int64),
+                               'cell_y': np.floor(mercator_y[located] / cell_size).astype(np.int64),
+                               'mothers_side': df_intervals['mothers_side'].to_numpy()[rows[located]]})
+
+    cell_columns = ['year', 'cell_x', 'cell_y']
+    cells = df_persons.groupby(cell_columns)
+    df_persons['cell_nr_of_persons'] = cells['row'].transform('size')
+    df_persons['cell_mercator_x'] = cells['mercator_x'].transform('mean')
+    df_persons['cell_mercator_y'] = cells['mercator_y'].transform('mean')
+
+    df_persons = df_persons.sort_values(cell_columns + ['mothers_side', 'row'], kind='stable').reset_index(drop=True)
+    df_clusters = df_persons.groupby(cell_columns + ['mothers_side'], sort=False).agg(
+        mercator_x_birth=('cell_mercator_x', 'first'), mercator_y_birth=('cell_mercator_y', 'first'),
+        cell_nr_of_persons=('cell_nr_of_persons', 'first'), nr_of_persons=('row', 'size')).reset_index()
+    df_clusters['glyph_size'] = cluster_glyph_sizes(df_clusters['cell_nr_of_persons'].to_numpy())
+    # The persons of a cluster are df_persons[first_row:last_row]
+    df_clusters['last_row'] = np.cumsum(df_clusters['nr_of_persons'].to_numpy())
+    df_clusters['first_row'] = df_clusters['last_row'] - df_clusters['nr_of_persons']
+
+    # Names and places of birth of the persons in the clusters, for the tooltip (at most CLUSTER_MAX_NAMES names)
+    names = np.array([' '.join(part for part in name if part) for name in 
+                      zip(df_intervals['Voornaam'], df_intervals['Voorvoegsel'], df_intervals['Achternaam'])], 
+                     dtype=object)
+    cluster_rows = df_persons['row'].to_numpy()
+    persons_names = names[cluster_rows].tolist()
+    persons_places_of_birth = df_intervals['place_of_birth'].to_numpy()[cluster_rows].tolist()
+    clusters_names, clusters_places_of_birth = [], []
+    for first_row, last_row in zip(df_clusters['first_row'].tolist(), df_clusters['last_row'].tolist()):
+        cluster_names = persons_names[first_row:min(last_row, first_row + CLUSTER_MAX_NAMES)]
+        if last_row - first_row > CLUSTER_MAX_NAMES:
+            cluster_names.append('...')
+        clusters_names.append(', '.join(cluster_names))
+        clusters_places_of_birth.append(', '.join(dict.fromkeys(persons_places_of_birth[first_row:last_row])))
+
+    # Split the clusters per year (the clusters are ordered by year)
+    cluster_columns = {column_name: df_clusters[column_name].tolist() for column_name in 
+                       ['mothers_side', 'mercator_x_birth', 'mercator_y_birth', 'glyph_size', 'nr_of_persons']}
+    cluster_columns.update({'names': clusters_names, 'place_of_birth': clusters_places_of_birth})
+    cluster_years = df_clusters['year'].to_numpy()
+    clusters_mercator_x = df_clusters['mercator_x_birth'].to_numpy(dtype=float)
+    clusters_mercator_y = df_clusters['mercator_y_birth'].to_numpy(dtype=float)
+    clusters_mercator_x.setflags(write=False)
+    clusters_mercator_y.setflags(write=False)
+    frames, positions = {}, {}
+    for year in year_index:
+        first_cluster, last_cluster = np.searchsorted(cluster_years, [year, year + 1]).tolist()
+        frames[year] = {column_name: cluster_values[first_cluster:last_cluster] 
+                        for column_name, cluster_values in cluster_columns.items()}
+        positions[year] = (clusters_mercator_x[first_cluster:last_cluster], 
+                           clusters_mercator_y[first_cluster:last_cluster])
+    return ClusterLevel(cell_size, frames, positions)
+
+
+def cluster_cell_size_for_extent(width, height):
+    """
+    Return the cell size (zoom level) to use for a map that is width by height mercator meters. The larger of the
+    two determines the cell size, so a tall and narrow map doesn't get too many small clusters.
+    """
+    map_size = max(width, height)
+    cell_sizes = [cell_size for cell_size in CLUSTER_CELL_SIZES if cell_size <= map_size / CLUSTER_CELLS_ACROSS]
+    return cell_sizes[-1] if cell_sizes else CLUSTER_CELL_SIZES[0]
+
+
+def cluster_extent(x_start, x_end, y_start, y_end):
+    """
+    Return the extent (x_start, x_end, y_start, y_end) of which the clusters are sent to the browser, for a map 
+    with the given (visible) ranges: these ranges extended with CLUSTER_EXTENT_MARGIN on every side
+    """
+    x_margin = CLUSTER_EXTENT_MARGIN * abs(x_end - x_start)
+    y_margin = CLUSTER_EXTENT_MARGIN * abs(y_end - y_start)
+    return (min(x_start, x_end) - x_margin, max(x_start, x_end) + x_margin,
+            min(y_start, y_end) - y_margin, max(y_start, y_end) + y_margin)
+
+
+def cluster_frame_data(cluster_level, year, extent=None):
+    """
+    Return the data of the clusters in the given year (for a ColumnDataSource), including the names and places
+    of birth of the persons in the clusters for the tooltip. With extent (see cluster_extent), only the clusters 
+    within that extent are included. This data is precomputed (see build_cluster_level) and shared, so it must 
+    not be modified.
+    """
+    frame_data = cluster_level.frames[year]
+    if extent is None:
+        return frame_data
+    x_start, x_end, y_start, y_end = extent
+    mercator_x, mercator_y = cluster_level.positions[year]
+    inside = (mercator_x >= x_start) & (mercator_x <= x_end) & (mercator_y >= y_start) & (mercator_y <= y_end)
+    if inside.all():
+        return frame_data
+    clusters = np.flatnonzero(inside).tolist()
+    return {column_name: [cluster_values[cluster] for cluster in clusters]
+            for column_name, cluster_values in frame_data.items()}
+
+
+# The migrations (from place of birth to place of death) per year. routes holds the columns (numpy arrays) of all
+# routes, i.e. pairs of place of birth and place of death. The routes taken by the persons alive in a year are
+# route_codes[year_offsets[year - first_year]:year_offsets[year - first_year + 1]], with the number of these persons
+# per route in nr_of_persons.
+MigrationIndex = namedtuple('MigrationIndex', ['first_year', 'routes', 'year_offsets', 'route_codes', 'nr_of_persons'])
+ROUTE_COLUMNS = ['mercator_x_birth', 'mercator_y_birth', 'mercator_x_death', 'mercator_y_death']
+ROUTE_TEXT_COLUMNS = ['place_of_birth', 'place_of_death']
+
+
+def build_migration_index(df_intervals, first_year, last_year):
+    """
+    Build the migration index (see MigrationIndex) for every year from first_year up to and including last_year.
+    Only persons who died in another place than where they were born, both with a geo location, are included.
+    """
+    located = np.ones(len(df_intervals.index), dtype=bool)
+    for column_name in ROUTE_COLUMNS:
+        located &= df_intervals[column_name].notna().to_numpy()
+    # The places are compared as text, as categoricals with different categories can't be compared
+    migrated = located & (df_intervals['place_of_birth'].to_numpy(dtype=object) != 
+                          df_intervals['place_of_death'].to_numpy(dtype=object))
+    df_migrated = df_intervals[migrated]
+
+    # Only the routes that occur (observed), not all combinations of the categories of the places
+    persons_route_codes = df_migrated.groupby(ROUTE_TEXT_COLUMNS, sort=False, observed=True).ngroup().to_numpy()
+    df_routes = df_migrated.drop_duplicates(ROUTE_TEXT_COLUMNS)
+    routes = {column_name: df_routes[column_name].to_numpy(dtype=float) for column_name in ROUTE_COLUMNS}
+    routes.update({column_name: df_routes[column_name].to_numpy(dtype=object) for column_name in ROUTE_TEXT_COLUMNS})
+
+    years_of_birth = df_migrated['year_of_birth'].to_numpy()
+    years_of_death = df_migrated['year_of_death'].to_numpy()
+    year_offsets = [0]
+    route_codes, nr_of_persons = [], []
+    for year in range(first_year, last_year + 1):
+        alive = (years_of_birth <= year) & (years_of_death >= year)
+        year_route_codes, year_nr_of_persons = np.unique(persons_route_codes[alive], return_counts=True)
+        route_codes.append(year_route_codes)
+        nr_of_persons.append(year_nr_of_persons)
+        year_offsets.append(year_offsets[-1] + len(year_route_codes))
+    return MigrationIndex(first_year, routes, np.array(year_offsets, dtype=np.int64),
+                          np.concatenate(route_codes).astype(np.int32), np.concatenate(nr_of_persons).astype(np.int32))
+
+
+def save_migration_index(migration_index, file_name=MIGRATIONS_FILE_NAME):
+    """
+    Write the migration index to a binary file (the place names encoded as by encode_texts)
+    """
+    columns = {'first_year': np.array(migration_index.first_year), 'year_offsets': migration_index.year_offsets,
+               'route_codes': migration_index.route_codes, 'nr_of_persons': migration_index.nr_of_persons}
+    for column_name in ROUTE_COLUMNS:
+        columns[column_name] = migration_index.routes[column_name]
+    for column_name in ROUTE_TEXT_COLUMNS:
+        columns[column_name + '.text'], columns[column_name + '.offsets'] = encode_texts(
+            migration_index.routes[column_name].tolist())
+    with open(file_name, 'wb') as binary_file:
+        np.savez(binary_file, **columns)
+
+
+def read_migration_index(file_name=MIGRATIONS_FILE_NAME):
+    """
+    Read the migration index as written by save_migration_index
+    """
+    with np.load(file_name) as columns:
+        routes = {column_name: columns[column_name] for column_name in ROUTE_COLUMNS}
+        routes.update({column_name: decode_texts(columns[column_name + '.text'], columns[column_name + '.offsets'])
+                       for column_name in ROUTE_TEXT_COLUMNS})
+        return MigrationIndex(int(columns['first_year']), routes, columns['year_offsets'], columns['route_codes'],
+                              columns['nr_of_persons'])
+
+
+def migration_frame_data(migration_index, year):
+    """
+    Return the data of the migrations in the given year (for a ColumnDataSource): one line per route, with a
+    line width based on the number of alive persons that took the route
+    """
+    year_offset = year - migration_index.first_year
+    if 0 <= year_offset < len(migration_index.year_offsets) - 1:
+        first_route, last_route = migration_index.year_offsets[year_offset:year_offset + 2]
+    else:
+        first_route = last_route = 0
+    route_codes = migration_index.route_codes[first_route:last_route]
+    nr_of_persons = migration_index.nr_of_persons[first_route:last_route]
+    frame_data = {column_name: migration_index.routes[column_name][route_codes].tolist()
+                  for column_name in ROUTE_COLUMNS + ROUTE_TEXT_COLUMNS}
+    frame_data['nr_of_persons'] = nr_of_persons.tolist()
+    frame_data['line_width'] = np.minimum(nr_of_persons, 10).tolist()
+    return frame_data
+
+
+# The prepared ancestors, shared by all sessions of the Bokeh server (see get_shared_ancestors)
+SharedAncestors = namedtuple('SharedAncestors', ['df_ancestors', 'start_year', 'last_year', 'year_index', 
+                                                 'cluster_levels'])
+_shared_ancestors = {}
+
+
+def get_shared_ancestors(file_name=INTERVALS_FILE_NAME, last_year=LAST_YEAR_OF_REFERENCE):
+    """
+    Return the prepared ancestors (the interval dataframe, the start year, the last year, the per-year index and
+    the clusters per zoom level, by cell size).
+    These are loaded only once per process: the Bokeh server runs main.py for every session, but the sessions all
+    share the same instance. Hence sessions must not modify it; the numpy arrays of the year index are read-only.
+    """
+    key = (file_name, last_year)
+    if key not in _shared_ancestors:
+        df_ancestors = load_ancestor_intervals(file_name)
+
+        # start year is the birth year of the oldest ancestor
+        start_year = int(df_ancestors['date_of_birth'].min(skipna=True).year)
+        year_index = build_year_index(df_ancestors, start_year, last_year)
+        for rows, glyph_sizes in year_index.values():
+            rows.setflags(write=False)
+            glyph_sizes.setflags(write=False)
+
+        cluster_levels = {cell_size: build_cluster_level(df_ancestors, year_index, cell_size) 
+                          for cell_size in CLUSTER_CELL_SIZES}
+
+        _shared_ancestors[key] = SharedAncestors(df_ancestors, start_year, last_year, year_index, cluster_levels)
+    return _shared_ancestors[key]
+
+
+_shared_migrations = {}
+
+
+def get_shared_migrations(file_name=MIGRATIONS_FILE_NAME, intervals_file_name=INTERVALS_FILE_NAME,
+                          last_year=LAST_YEAR_OF_REFERENCE):
+    """
+    Return the migration index of the shared ancestors (see get_shared_ancestors), loaded only once per process
+    and only when needed. The index as precomputed by 'generate_ancestor_file.py' is used if it is up to date
+    and covers all years of the map; otherwise it is built from the shared ancestors.
+    """
+    key = (file_name, intervals_file_name, last_year)
+    if key not in _shared_migrations:
+        shared_ancestors = get_shared_ancestors(intervals_file_name, last_year)
+        migration_index = None
+        if is_binary_file_up_to_date(file_name, intervals_file_name):
+            migration_index = read_migration_index(file_name)
+            nr_of_years = len(migration_index.year_offsets) - 1
+            if (migration_index.first_year > shared_ancestors.start_year
+                    or migration_index.first_year + nr_of_years - 1 < last_year):
+                migration_index = None
+        if migration_index is None:
+            migration_index = build_migration_index(shared_ancestors.df_ancestors, shared_ancestors.start_year,
+                                                    last_year)
+        _shared_migrations[key] = migration_index
+    return _shared_migrations[key]
@@ -0,0 +1,175 @@
+import argparse
+import datetime
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+REPOSITORY_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY_DIRECTORY)
+
+import numpy as np
+import pandas as pd
+import bokeh
+from bokeh.application.handlers import ScriptHandler
+from bokeh.document import Document
+from bokeh.events import RangesUpdate
+from bokeh.models import Slider
+import ancestor_data
+import generate_ancestor_file as generator
+from synthetic_tree import write_synthetic_tree
+
+
+"""
+Benchmarks of the generation pipeline ('generate_ancestor_file.py') and of loading the data and the slider and zoom
+callbacks of the map ('main.py'), on synthetic family trees (see synthetic_tree.py) of different sizes.
+
+Every stage is timed separately, and the results are written as JSON, so they can be compared across commits and
+plotted as scaling curves. For example:
+
+    python benchmarks/bench_ancestormap.py --persons 100 1000 10000 --places 50 --output bench.json
+"""
+
+
+def time_stage(results, tree, benchmark, stage, function, *args, **kwargs):
+    """
+    Run function once and add its duration to the results; return the result of the function
+    """
+    start_time = time.perf_counter()
+    result = function(*args, **kwargs)
+    results.append(dict(tree, benchmark=benchmark, stage=stage, seconds=time.perf_counter() - start_time))
+    return result
+
+
+def benchmark_generation(results, tree, nr_of_workers):
+    """
+    Time every stage of generate_ancestor_file.py (in the current directory), and the complete expansion and
+    writing of the export file in chunks by nr_of_workers processes
+    """
+    df_ancestors, df_cities = time_stage(results, tree, 'generate', 'read_input_files', generator.read_input_files)
+    df_ancestors_total = time_stage(results, tree, 'generate', 'merge_cities', generator.merge_cities, df_ancestors, df_cities)
+    df_ancestors_total = time_stage(results, tree, 'generate', 'parse_dates', generator.parse_dates, df_ancestors_total)
+    start_year = generator.determine_start_year(df_ancestors_total)
+    nr_of_rows_per_person = ancestor_data.LAST_YEAR_OF_REFERENCE + 1 - start_year
+
+    time_stage(results, tree, 'generate', 'write_interval_files', generator.write_interval_files, df_ancestors_total)
+    time_stage(results, tree, 'generate', 'write_migration_file', generator.write_migration_file, df_ancestors_total,
+               start_year, ancestor_data.LAST_YEAR_OF_REFERENCE)
+    df_ancestors_incl_years = time_stage(results, tree, 'generate', 'repeat_ancestors_per_year',
+                                         generator.repeat_ancestors_per_year, df_ancestors_total, start_year,
+                                         nr_of_rows_per_person)
+    place_codes, alive_counts = time_stage(results, tree, 'generate', 'count_alive_persons',
+                                           ancestor_data.count_alive_persons_per_birthplace, df_ancestors_total,
+                                           start_year, nr_of_rows_per_person)
+    df_ancestors_incl_years = time_stage(results, tree, 'generate', 'add_alive_counts', generator.add_alive_counts,
+                                         df_ancestors_incl_years, place_codes, alive_counts, start_year,
+                                         nr_of_rows_per_person)
+    time_stage(results, tree, 'generate', 'write_export_file', generator.write_export_file, df_ancestors_incl_years)
+    del df_ancestors_incl_years
+    time_stage(results, tree, 'generate', f'write_export_file_in_chunks_x{nr_of_workers}',
+               generator.write_export_file_in_chunks, df_ancestors_total, start_year, nr_of_rows_per_person,
+               nr_of_workers=nr_of_workers)
+
+
+def benchmark_map(results, tree, nr_of_callbacks):
+    """
+    Time loading the data of main.py, creating a session document and the slider and zoom callbacks (in the
+    current directory, after benchmark_generation)
+    """
+    file_name = ancestor_data.INTERVALS_FILE_NAME
+    time_stage(results, tree, 'map', 'load_intervals_binary', ancestor_data.read_ancestor_intervals_binary,
+               ancestor_data.binary_file_name(file_name))
+    os.remove(ancestor_data.binary_file_name(file_name))
+    df_ancestors = time_stage(results, tree, 'map', 'load_intervals_csv', ancestor_data.load_ancestor_intervals, file_name)
+    start_year = int(df_ancestors['date_of_birth'].min().year)
+    year_index = time_stage(results, tree, 'map', 'build_year_index', ancestor_data.build_year_index, df_ancestors,
+                            start_year, ancestor_data.LAST_YEAR_OF_REFERENCE)
+    time_stage(results, tree, 'map', 'build_cluster_levels', lambda: [
+        ancestor_data.build_cluster_level(df_ancestors, year_index, cell_size) for cell_size in ancestor_data.CLUSTER_CELL_SIZES])
+    time_stage(results, tree, 'map', 'read_migration_index', ancestor_data.read_migration_index)
+
+    # The shared data is loaded on creating the first session (as without server lifecycle hooks), so create 2 sessions
+    ancestor_data._shared_ancestors.clear()
+    for stage in ['create_first_session', 'create_session']:
+        handler = ScriptHandler(filename=os.path.join(REPOSITORY_DIRECTORY, 'main.py'))
+        document = Document()
+        time_stage(results, tree, 'map', stage, handler.modify_document, document)
+        if handler.failed:
+            raise RuntimeError(handler.error_detail)
+
+    # Slider callback: step through the years, as on playing the animation
+    slider = next(model for model in document.models if isinstance(model, Slider))
+    years = itertools.cycle(range(slider.start, slider.end + 1))
+
+    def move_slider():
+        for callback in range(nr_of_callbacks):
+            slider.value = next(years)
+    time_stage(results, tree, 'map', f'slider_callback_x{nr_of_callbacks}', move_slider)
+
+    # Zoom callback: zoom in and out around the center of the map, switching between zoom levels of the clusters
+    map_plot = document.roots[0].children[0]
+    center_x = (map_plot.x_range.start + map_plot.x_range.end) / 2
+    center_y = (map_plot.y_range.start + map_plot.y_range.end) / 2
+    zoom_widths = itertools.cycle([1000 * 2 ** level * ancestor_data.CLUSTER_CELLS_ACROSS for level in range(10)])
+
+    def zoom():
+        for callback in range(nr_of_callbacks):
+            zoom_width = next(zoom_widths)
+            map_plot._trigger_event(RangesUpdate(map_plot, x0=center_x - zoom_width / 2, x1=center_x + zoom_width / 2,
+                                                 y0=center_y - zoom_width / 2, y1=center_y + zoom_width / 2))
+    time_stage(results, tree, 'map', f'zoom_callback_x{nr_of_callbacks}', zoom)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPOSITORY_DIRECTORY, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the generation pipeline and the map callbacks")
+    parser.add_argument('--persons', type=int, nargs='+', default=[157, 1000], help="numbers of persons")
+    parser.add_argument('--places', type=int, nargs='+', default=[35], help="numbers of places")
+    parser.add_argument('--first-year', type=int, nargs='+', default=[1724], help="first years of birth")
+    parser.add_argument('--callbacks', type=int, default=100, help="number of slider and zoom callbacks to time")
+    parser.add_argument('--workers', type=int, default=1, help="number of processes for the chunked generation")
+    parser.add_argument('--skip-map', action='store_true', help="only benchmark the generation pipeline")
+    parser.add_argument('--output', help="JSON file to write the results to (default: standard output)")
+    args = parser.parse_args()
+
+    # Bokeh warns about deprecated usage in main.py on every session; that is not of interest here
+    warnings.filterwarnings('ignore')
+    results = []
+    working_directory = os.getcwd()
+    for nr_of_persons, nr_of_places, first_year in itertools.product(args.persons, args.places, args.first_year):
+        tree = dict(persons=nr_of_persons, places=nr_of_places, first_year=first_year)
+        with tempfile.TemporaryDirectory() as directory:
+            write_synthetic_tree(directory, nr_of_persons, nr_of_places, first_year)
+            os.chdir(directory)
+            try:
+                benchmark_generation(results, tree, args.workers)
+                if not args.skip_map:
+                    benchmark_map(results, tree, args.callbacks)
+            finally:
+                os.chdir(working_directory)
+        print(f"Benchmarked {tree}", file=sys.stderr)
+
+    report = {'commit': git_commit(), 'date': datetime.datetime.now().isoformat(timespec='seconds'),
+              'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+              'bokeh': bokeh.__version__, 'results': results}
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+import argparse
+import numpy as np
+import pandas as pd
+
+
+"""
+This file generates a synthetic family tree, in the same format as 'maps_ancestors.csv' and 'maps_cities.csv', to
+be able to benchmark 'generate_ancestor_file.py' and 'main.py' with more persons, places and years than in the real
+family tree. The number of persons, the number of places and the first year of birth can be chosen; the generated
+tree is always the same for the same arguments (and seed).
+"""
+
+
+ANCESTOR_COLUMNS = ['Persoon', 'Achternaam', 'Voornaam', 'Roep', 'Achtervoegsel', 'Voorvoegsel', 'Titel', 'Geslacht',
+                    'date_of_birth', 'place_of_birth', 'Geboortebron', 'doopdatum', 'doopplaats', 'Doopbron',
+                    'date_of_death', 'place_of_death', 'Overlijdensbron', 'Begrafenisdatum', 'Begraafplaats',
+                    'Begrafenisbron', 'Opmerking', 'mothers_side', '']
+FIRST_NAMES = ['Adriaan', 'Adriana', 'Anna', 'Antonius', 'Cornelia', 'Cornelis', 'Geertruida', 'Hendrica',
+               'Hendricus', 'Johanna', 'Johannes', 'Maria', 'Petrus', 'Willem']
+LAST_NAMES = ['van Drunen', 'Akkermans', 'van Boekel', 'de Bont', 'Hendriks', 'van Rooij', 'van Gils', 'Kamp']
+UNKNOWN_DATE = '2199-12-31'
+
+# Bounding box (mercator meters) of the Netherlands and Belgium, in which the places are generated
+MERCATOR_X_RANGE = (280000, 800000)
+MERCATOR_Y_RANGE = (6400000, 7100000)
+EARTH_RADIUS = 6378137
+
+
+def generate_cities(nr_of_places, random):
+    """
+    Generate nr_of_places cities at random locations, in the format of 'maps_cities.csv'
+    """
+    mercator_x = random.uniform(*MERCATOR_X_RANGE, nr_of_places).round()
+    mercator_y = random.uniform(*MERCATOR_Y_RANGE, nr_of_places).round()
+    return pd.DataFrame({'name': [f'Place {place}' for place in range(nr_of_places)],
+                         'latitude': np.degrees(2 * np.arctan(np.exp(mercator_y / EARTH_RADIUS)) - np.pi / 2).round(6),
+                         'longitude': np.degrees(mercator_x / EARTH_RADIUS).round(6),
+                         'mercator_x': mercator_x.astype(int), 'mercator_y': mercator_y.astype(int)})
+
+
+def generate_ancestors(nr_of_persons, df_cities, first_year, last_year, random):
+    """
+    Generate nr_of_persons persons born between first_year and last_year, in the format of 'maps_ancestors.csv'.
+    Like in the real family tree, some persons have an unknown date of birth or place of birth.
+    """
+    first_day = np.datetime64(f'{first_year}-01-01')
+    nr_of_days = (np.datetime64(f'{last_year}-12-31') - first_day).astype(int)
+    dates_of_birth = first_day + random.integers(0, nr_of_days + 1, nr_of_persons).astype('timedelta64[D]')
+    dates_of_death = dates_of_birth + random.integers(0, 95 * 365, nr_of_persons).astype('timedelta64[D]')
+    dates_of_birth = np.datetime_as_string(dates_of_birth, unit='D').astype(object)
+    dates_of_death = np.datetime_as_string(dates_of_death, unit='D').astype(object)
+    dates_of_birth[random.random(nr_of_persons) < 0.05] = UNKNOWN_DATE
+
+    places = df_cities['name'].to_numpy(dtype=object)
+    places_of_birth = places[random.integers(0, len(places), nr_of_persons)]
+    places_of_birth[random.random(nr_of_persons) < 0.05] = ''
+    places_of_death = places[random.integers(0, len(places), nr_of_persons)]
+
+    df_ancestors = pd.DataFrame('', index=range(nr_of_persons), columns=ANCESTOR_COLUMNS)
+    df_ancestors['Persoon'] = np.arange(1, nr_of_persons + 1)
+    df_ancestors['Achternaam'] = random.choice(LAST_NAMES, nr_of_persons)
+    df_ancestors['Voornaam'] = random.choice(FIRST_NAMES, nr_of_persons)
+    df_ancestors['Geslacht'] = random.choice(['mannelijk', 'vrouwelijk'], nr_of_persons)
+    df_ancestors['date_of_birth'] = dates_of_birth
+    df_ancestors['place_of_birth'] = places_of_birth
+    df_ancestors['date_of_death'] = dates_of_death
+    df_ancestors['place_of_death'] = places_of_death
+    df_ancestors['mothers_side'] = random.choice(['N', 'Y', 'X'], nr_of_persons, p=[0.48, 0.48, 0.04])
+    return df_ancestors
+
+
+def write_synthetic_tree(directory, nr_of_persons, nr_of_places, first_year, last_year=1930, seed=0):
+    """
+    Write 'maps_ancestors.csv' and 'maps_cities.csv' with a synthetic family tree to the given directory
+    """
+    random = np.random.default_rng(seed)
+    df_cities = generate_cities(nr_of_places, random)
+    df_ancestors = generate_ancestors(nr_of_persons, df_cities, first_year, last_year, random)
+    df_cities.to_csv(f'{directory}/maps_cities.csv', index=None, header=True)
+    df_ancestors.to_csv(f'{directory}/maps_ancestors.csv', index=None, header=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a synthetic family tree")
+    parser.add_argument('directory', help="directory to write maps_ancestors.csv and maps_cities.csv to")
+    parser.add_argument('--persons', type=int, default=1000, help="number of persons")
+    parser.add_argument('--places', type=int, default=100, help="number of places")
+    parser.add_argument('--first-year', type=int, default=1700, help="first year of birth")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the random generator")
+    args = parser.parse_args()
+    write_synthetic_tree(args.directory, args.persons, args.places, args.first_year, seed=args.seed)
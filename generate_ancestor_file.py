@@ -1,110 +1,504 @@
+import argparse
+import collections
+import csv
+import io
+import gzip
+import hashlib
+import json
+import os
+import time
 import pandas as pd
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, date
+from ancestor_data import count_alive_persons_per_birthplace, save_ancestor_intervals_binary, binary_file_name, \
+    to_dates, build_migration_index, save_migration_index, INTERVAL_COLUMNS, INTERVALS_FILE_NAME, \
+    LAST_YEAR_OF_REFERENCE
 
 
 """
-This file will generate a CSV file ('exported_ancestor_list.csv') that will be used in another Python 
+This file will generate a CSV file ('exported_ancestor_list.csv') that will be used in another Python
 file (main.py) to plot the ancestors in time on a Geo map using Bokeh.
-Note that this CSV file 
+Note that this CSV file contains every person once for every year. As this results in a lot of rows, also a
+compact CSV file ('exported_ancestor_intervals.csv') is generated, with one row per person including the year
+of birth and year of death. This is the file that is used by main.py. The same data is also written to a
+columnar binary file ('exported_ancestor_intervals.npz'), which main.py loads faster than the CSV file.
+For the migration layer of the map, the routes from place of birth to place of death per year are precomputed
+into 'exported_ancestor_migrations.npz'.
 
 It uses as input files 2 other CSV files:
     1. 'maps_cities.csv' which contains all cities where my ancestors were born or died, including their geo locations
     2. 'maps_ancestors.csv' which contains all my ancestors with info on e.g. names, birth dates, etc.
        Note that if a birth date or date of death is unknown, it is populated with '2199-12-31'.
-       Also, if the date of birth is known, but the date of death is not, the date of death is set to 50 years 
+       Also, if the date of birth is known, but the date of death is not, the date of death is set to 50 years
        later with month and day of 12-31.
        This all to facilitate the coding of plotting the ancestors on the geo map.
+
+Run with option --incremental to only regenerate what changed since the previous run. For that, the content hashes
+of the rows of the input files are stored in a manifest ('exported_ancestor_manifest.json'). Only the persons that
+changed (or that were born in the same place as a changed person) are regenerated; the rows of all other persons
+are copied from the previous 'exported_ancestor_list.csv'. The result is the same as a complete run.
+
+A complete run expands and writes the persons in chunks (option --chunk-size, in persons), so only a few chunks are
+in memory at the same time. For large family trees, the chunks can be expanded in parallel by multiple processes
+(option --workers); they are still written in order, so the export file is the same as with 1 worker. The last
+year in the export file can be set with option --last-year (e.g. the current year instead of 1940).
+The export file is first written to 'exported_ancestor_list.csv.partial', and after every chunk the progress is
+reported and saved ('exported_ancestor_list.csv.progress'). So if a run is interrupted, it can be continued with
+option --resume (with the same input files and options). With option --gzip, the export file is compressed
+('exported_ancestor_list.csv.gz'); every chunk is a separate gzip member, which gzip and pandas read as one file.
 """
 
 
-# First read the data
-df_cities_place_of_birth = pd.read_csv('maps_cities.csv')
-df_cities_place_of_death = pd.read_csv('maps_cities.csv')
-df_ancestors = pd.read_csv('maps_ancestors.csv')
-
-# Combine the 3 dataframes. To be able to do that, based on same column_name, first rename the city 
-# dataframes to ensure the geological data columns have separate names
-df_cities_place_of_birth = df_cities_place_of_birth.rename(columns={'name': 'place_of_birth', 
-                                'latitude': 'latitude_birth', 'longitude': 'longitude_birth', 
-                                'mercator_x': 'mercator_x_birth', 'mercator_y': 'mercator_y_birth'})
-df_cities_place_of_death = df_cities_place_of_death.rename(columns={'name': 'place_of_death', 
-                                'latitude': 'latitude_death', 'longitude': 'longitude_death', 
-                                'mercator_x': 'mercator_x_death', 'mercator_y': 'mercator_y_death'})
-df_ancestors_place_of_birth = df_ancestors.merge(df_cities_place_of_birth, on='place_of_birth', how="left")
-df_ancestors_total = df_ancestors_place_of_birth.merge(df_cities_place_of_death, on='place_of_death', how="left")
-
-# Set empty date fields as NaN, as is the case for regular string fields, so they can be cleaned properly
-# df_ancestors_total.date_of_birth.astype(object).where(df_ancestors_total.date_of_birth.notnull(), None)
-# df_ancestors_total.date_of_death.astype(object).where(df_ancestors_total.date_of_death.notnull(), None)
-# Note that I don't do this anymore; gave quite some headaches. Solved the issue by ensuring data is always
-# filled: 2199-12-31 if date of death or date of birth is unknown
-
-# Set date fields as date type fields
-# Note that the order of above 3 blocks is very important! Below statements HAVE to be last!
-df_ancestors_total['date_of_birth'] = pd.to_datetime(df_ancestors_total['date_of_birth'], format="%Y-%m-%d")
-df_ancestors_total['date_of_death'] = pd.to_datetime(df_ancestors_total['date_of_death'], format="%Y-%m-%d")
-
-# determine birth year of oldest ancestor
-start_year = df_ancestors_total['date_of_birth'].min(skipna=True)
-start_year = datetime.strftime(start_year, '%Y%m%d')
-start_year = int(start_year[0:4])
-current_year = date.today().year
-
-# extend df with year of birth and year of death in new columns
-df_ancestors_total['year_of_birth'] = df_ancestors_total.apply(lambda row: int(datetime.strftime(row.date_of_birth, '%Y%m%d')[0:4]), axis = 1)
-df_ancestors_total['year_of_death'] = df_ancestors_total.apply(lambda row: int(datetime.strftime(row.date_of_death, '%Y%m%d')[0:4]), axis = 1)
-
-# Again add 3 new columns to dataframe: 
-#       1. year_of_reference 
-#       2. if_alive_nr_of_alive_persons_same_birthplace
-#       3. glyph size based on 'if_alive_nr_of_alive_persons_same_birthplace'
-new_columns = ("year_of_reference", "if_alive_nr_of_alive_persons_same_birthplace", "glyph_size")
-dataframe_year_list = pd.DataFrame(columns=new_columns)
-df_ancestors_extended = pd.concat([df_ancestors_total, dataframe_year_list], axis=1)
-
-# Now duplicate persons multiple times so every person is in multiple rows, from start_year to 1941 with the column 
-# year_of_reference filled with the respective year
-times_repeat_persons_in_df = 1941 - start_year
-df_ancestors_incl_years = df_ancestors_extended.loc[df_ancestors_extended.index.repeat(times_repeat_persons_in_df)].reset_index(drop=True)
-
-# Clean up dataframe, replacing all NaN values with an empty string
-df_ancestors_total = df_ancestors_total.replace(np.nan, '', regex=True)
-
-# Fill new column year_of_reference; for every person one year between start_year and 1941
-nr_of_rows_per_person = (1941 - start_year)
-for index, person in df_ancestors_incl_years.iterrows():
-    year_to_set = (index % nr_of_rows_per_person) + start_year        
-    df_ancestors_incl_years.at[index, 'year_of_reference'] = year_to_set
-
-# Fill new column if_alive_nr_of_alive_persons_same_birthplace
-for index, person in df_ancestors_incl_years.iterrows():
-    persons_year_of_birth = df_ancestors_incl_years.at[index, "year_of_birth"]
-    persons_year_of_death = df_ancestors_incl_years.at[index, "year_of_death"]
-    persons_year_of_reference = df_ancestors_incl_years.at[index, "year_of_reference"]
-
-    if ((persons_year_of_birth <= persons_year_of_reference) and (persons_year_of_death >= persons_year_of_reference)):
-        # Person was alive
-        persons_place_of_birth = df_ancestors_incl_years.at[index, "place_of_birth"]
-        # Determine number of persons alive in this year, born in the same place
-        nr_persons_cond = ((df_ancestors_incl_years["year_of_birth"]<=persons_year_of_reference) & (df_ancestors_incl_years["year_of_death"]>=persons_year_of_reference) & (df_ancestors_incl_years["place_of_birth"]==persons_place_of_birth) & (df_ancestors_incl_years["year_of_reference"]==persons_year_of_reference))
-        persons_alive_and_born_same_place = df_ancestors_incl_years[nr_persons_cond]
-        nr_of_persons = len(persons_alive_and_born_same_place.index)
-        # set value to nr_of_persons for this person in this year
-        df_ancestors_incl_years.at[index, 'if_alive_nr_of_alive_persons_same_birthplace'] = nr_of_persons
-    else:
-        # set value to 0 for this person in this year
-        df_ancestors_incl_years.at[index, 'if_alive_nr_of_alive_persons_same_birthplace'] = 0
-
-# Fill new column glyph_size, baseif_alive_nr_of_alive_persons_same_birthplace
-for index, person in df_ancestors_incl_years.iterrows():
-    persons_nr_alive_same_birthplace = df_ancestors_incl_years.at[index, "if_alive_nr_of_alive_persons_same_birthplace"]
-    if persons_nr_alive_same_birthplace > 0:
-        persons_glyph_size = df_ancestors_incl_years.at[index, "if_alive_nr_of_alive_persons_same_birthplace"] + 5
+ANCESTORS_FILE_NAME = 'maps_ancestors.csv'
+CITIES_FILE_NAME = 'maps_cities.csv'
+EXPORT_FILE_NAME = 'exported_ancestor_list.csv'
+MANIFEST_FILE_NAME = 'exported_ancestor_manifest.json'
+# Default number of persons per chunk of the export file (see write_export_file_in_chunks)
+CHUNK_SIZE = 1000
+
+
+def read_input_files():
+    """
+    Read the ancestors and the cities
+    """
+    df_ancestors = pd.read_csv(ANCESTORS_FILE_NAME)
+    df_cities = pd.read_csv(CITIES_FILE_NAME)
+    return df_ancestors, df_cities
+
+
+def merge_ancestors_and_cities(df_ancestors, df_cities):
+    """
+    Combine the ancestors with the geo locations of their place of birth and place of death, and extend it with
+    the year of birth and year of death
+    """
+    df_ancestors_total = merge_cities(df_ancestors, df_cities)
+    return parse_dates(df_ancestors_total)
+
+
+def merge_cities(df_ancestors, df_cities):
+    """
+    Combine the ancestors with the geo locations of their place of birth and place of death
+    """
+    # Combine the 3 dataframes. To be able to do that, based on same column_name, first rename the city
+    # dataframes to ensure the geological data columns have separate names
+    df_cities_place_of_birth = df_cities.rename(columns={'name': 'place_of_birth',
+                                    'latitude': 'latitude_birth', 'longitude': 'longitude_birth',
+                                    'mercator_x': 'mercator_x_birth', 'mercator_y': 'mercator_y_birth'})
+    df_cities_place_of_death = df_cities.rename(columns={'name': 'place_of_death',
+                                    'latitude': 'latitude_death', 'longitude': 'longitude_death',
+                                    'mercator_x': 'mercator_x_death', 'mercator_y': 'mercator_y_death'})
+    df_ancestors_place_of_birth = df_ancestors.merge(df_cities_place_of_birth, on='place_of_birth', how="left")
+    df_ancestors_total = df_ancestors_place_of_birth.merge(df_cities_place_of_death, on='place_of_death', how="left")
+    return df_ancestors_total
+
+
+def parse_dates(df_ancestors_total):
+    """
+    Set the date fields as date type fields, and extend the ancestors with the year of birth and year of death
+    """
+    # Set empty date fields as NaN, as is the case for regular string fields, so they can be cleaned properly
+    # df_ancestors_total.date_of_birth.astype(object).where(df_ancestors_total.date_of_birth.notnull(), None)
+    # df_ancestors_total.date_of_death.astype(object).where(df_ancestors_total.date_of_death.notnull(), None)
+    # Note that I don't do this anymore; gave quite some headaches. Solved the issue by ensuring data is always
+    # filled: 2199-12-31 if date of death or date of birth is unknown
+
+    # Set date fields as date type fields (see to_dates in ancestor_data.py; also supports dates before 1677)
+    # Note that the order of above 3 blocks is very important! Below statements HAVE to be last!
+    df_ancestors_total['date_of_birth'] = to_dates(df_ancestors_total['date_of_birth'])
+    df_ancestors_total['date_of_death'] = to_dates(df_ancestors_total['date_of_death'])
+
+    # extend df with year of birth and year of death in new columns
+    df_ancestors_total['year_of_birth'] = df_ancestors_total['date_of_birth'].dt.year
+    df_ancestors_total['year_of_death'] = df_ancestors_total['date_of_death'].dt.year
+    return df_ancestors_total
+
+
+def determine_start_year(df_ancestors_total):
+    """
+    Determine birth year of oldest ancestor
+    """
+    start_year = df_ancestors_total['date_of_birth'].min(skipna=True)
+    start_year = datetime.strftime(start_year, '%Y%m%d')
+    return int(start_year[0:4])
+
+
+def write_interval_files(df_ancestors_total):
+    """
+    Create compact csv file (and its binary equivalent), with one row per person (see ancestor_data.py)
+    """
+    df_ancestors_total[INTERVAL_COLUMNS].to_csv(INTERVALS_FILE_NAME, index=None, header=True)
+    save_ancestor_intervals_binary(df_ancestors_total[INTERVAL_COLUMNS], binary_file_name(INTERVALS_FILE_NAME))
+
+
+def write_migration_file(df_ancestors_total, start_year, last_year):
+    """
+    Create the per-year index of the migration layer of main.py (see build_migration_index in ancestor_data.py)
+    """
+    save_migration_index(build_migration_index(df_ancestors_total, start_year, last_year))
+
+
+def expand_ancestors_per_year(df_ancestors_total, start_year, nr_of_rows_per_person):
+    """
+    Repeat every person once for every year from start_year, and add for every year whether the person was alive,
+    the number of alive persons born in the same place and the glyph size. Note that the number of alive persons
+    is determined within df_ancestors_total, so it has to contain all persons born in the same place.
+    """
+    df_ancestors_incl_years = repeat_ancestors_per_year(df_ancestors_total, start_year, nr_of_rows_per_person)
+    place_codes, alive_counts = count_alive_persons_per_birthplace(df_ancestors_total, start_year, nr_of_rows_per_person)
+    return add_alive_counts(df_ancestors_incl_years, place_codes, alive_counts, start_year, nr_of_rows_per_person)
+
+
+def repeat_ancestors_per_year(df_ancestors_total, start_year, nr_of_rows_per_person):
+    """
+    Repeat every person once for every year from start_year, with the year in column year_of_reference
+    """
+    # Again add 3 new columns to dataframe:
+    #       1. year_of_reference
+    #       2. if_alive_nr_of_alive_persons_same_birthplace
+    #       3. glyph size based on 'if_alive_nr_of_alive_persons_same_birthplace'
+    new_columns = ("year_of_reference", "if_alive_nr_of_alive_persons_same_birthplace", "glyph_size")
+    dataframe_year_list = pd.DataFrame(columns=new_columns)
+    df_ancestors_extended = pd.concat([df_ancestors_total.reset_index(drop=True), dataframe_year_list], axis=1)
+
+    # Now duplicate persons multiple times so every person is in multiple rows, from start_year to the last year
+    # of reference with the column year_of_reference filled with the respective year
+    df_ancestors_incl_years = df_ancestors_extended.loc[df_ancestors_extended.index.repeat(nr_of_rows_per_person)].reset_index(drop=True)
+
+    # Fill new column year_of_reference; for every person one year between start_year and the last year of reference
+    years_of_reference = np.arange(start_year, start_year + nr_of_rows_per_person)
+    df_ancestors_incl_years['year_of_reference'] = np.tile(years_of_reference, len(df_ancestors_extended.index))
+    return df_ancestors_incl_years
+
+
+def add_alive_counts(df_ancestors_incl_years, place_codes, alive_counts, start_year, nr_of_rows_per_person):
+    """
+    Fill the number of alive persons born in the same place and the glyph size of the repeated persons (see 
+    repeat_ancestors_per_year), given the place codes of the persons and the alive counts per place and year (see
+    count_alive_persons_per_birthplace)
+    """
+    # Fill new column if_alive_nr_of_alive_persons_same_birthplace: the number of alive persons born in the same
+    # place in the year of reference, or 0 if the person was not alive (or the place of birth is unknown)
+    persons_place_codes = np.repeat(place_codes, nr_of_rows_per_person)
+    persons_year_index = df_ancestors_incl_years['year_of_reference'].to_numpy() - start_year
+    persons_alive = ((persons_place_codes >= 0)
+                     & (df_ancestors_incl_years['year_of_birth'].to_numpy() <= df_ancestors_incl_years['year_of_reference'].to_numpy())
+                     & (df_ancestors_incl_years['year_of_death'].to_numpy() >= df_ancestors_incl_years['year_of_reference'].to_numpy()))
+    # Only look up the alive counts of the alive persons: the others may have no place of birth (code -1), and if
+    # none of the persons has a known place of birth, alive_counts has no rows at all
+    persons_nr_alive_same_birthplace = np.zeros(len(persons_alive), dtype=alive_counts.dtype)
+    persons_nr_alive_same_birthplace[persons_alive] = alive_counts[persons_place_codes[persons_alive],
+                                                                   persons_year_index[persons_alive]]
+    df_ancestors_incl_years['if_alive_nr_of_alive_persons_same_birthplace'] = persons_nr_alive_same_birthplace
+
+    # Fill new column glyph_size, based on if_alive_nr_of_alive_persons_same_birthplace
+    persons_nr_alive_same_birthplace = df_ancestors_incl_years['if_alive_nr_of_alive_persons_same_birthplace']
+    df_ancestors_incl_years['glyph_size'] = np.where(persons_nr_alive_same_birthplace > 0, persons_nr_alive_same_birthplace + 5, 0)
+    return df_ancestors_incl_years
+
+
+def write_export_file(df_ancestors_incl_years):
+    """
+    Create csv file for new created dataframe
+    """
+    df_ancestors_incl_years.to_csv(EXPORT_FILE_NAME, index=None, header=True)
+
+
+def expand_chunk_to_csv(df_chunk, place_codes, alive_counts, start_year, nr_of_rows_per_person, header, compress):
+    """
+    Expand a chunk of persons per year (see expand_ancestors_per_year) and return its rows as UTF-8 encoded CSV
+    text, compressed as a gzip member if compress is set. This runs in a worker process, so all arguments are sent
+    to it; alive_counts therefore only contains the rows of the places of the persons in the chunk.
+    """
+    df_chunk_incl_years = repeat_ancestors_per_year(df_chunk, start_year, nr_of_rows_per_person)
+    df_chunk_incl_years = add_alive_counts(df_chunk_incl_years, place_codes, alive_counts, start_year, nr_of_rows_per_person)
+    chunk_csv = df_chunk_incl_years.to_csv(index=None, header=header).encode('utf-8')
+    # mtime=0, so the compressed file is the same on every run
+    return gzip.compress(chunk_csv, mtime=0) if compress else chunk_csv
+
+
+def map_in_order(function, arguments, nr_of_workers):
+    """
+    Yield function(*args) for every args in arguments, in order. With more than 1 worker the calls are run in a
+    process pool, with at most 2 calls per worker submitted at the same time to bound the memory usage.
+    """
+    if nr_of_workers <= 1:
+        for args in arguments:
+            yield function(*args)
+        return
+
+    with ProcessPoolExecutor(max_workers=nr_of_workers) as executor:
+        futures = collections.deque()
+        for args in arguments:
+            futures.append(executor.submit(function, *args))
+            if len(futures) >= 2 * nr_of_workers:
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
+
+
+def export_file_name(compress=False):
+    return EXPORT_FILE_NAME + '.gz' if compress else EXPORT_FILE_NAME
+
+
+def read_export_progress(progress_file_name, partial_file_name, run_key):
+    """
+    Return the number of persons and the size of the partial export file after the last completely written chunk
+    of a previous run with the same run_key, or (0, 0) if there is nothing to resume
+    """
+    if not (os.path.exists(progress_file_name) and os.path.exists(partial_file_name)):
+        return 0, 0
+    with open(progress_file_name) as progress_file:
+        progress = json.load(progress_file)
+    if progress['run_key'] != run_key or os.path.getsize(partial_file_name) < progress['file_size']:
+        return 0, 0
+    return progress['nr_of_persons'], progress['file_size']
+
+
+def write_export_progress(progress_file_name, run_key, nr_of_persons, file_size):
+    # Replace the progress file at once, so it is never half written
+    with open(progress_file_name + '.tmp', 'w') as progress_file:
+        json.dump({'run_key': run_key, 'nr_of_persons': nr_of_persons, 'file_size': file_size}, progress_file)
+    os.replace(progress_file_name + '.tmp', progress_file_name)
+
+
+def report_progress(nr_of_persons_written, nr_of_persons, start_time):
+    print(f"Written {nr_of_persons_written} of {nr_of_persons} persons "
+          f"({100 * nr_of_persons_written / max(nr_of_persons, 1):.0f}%) in {time.perf_counter() - start_time:.1f} s",
+          flush=True)
+
+
+def write_export_file_in_chunks(df_ancestors_total, start_year, nr_of_rows_per_person, chunk_size=CHUNK_SIZE,
+                                nr_of_workers=1, compress=False, run_key='', resume=False, progress=False):
+    """
+    Expand the persons per year and write them to the export file, in chunks of chunk_size persons, optionally
+    with multiple worker processes and compressed. The result is the same as 
+    write_export_file(expand_ancestors_per_year(...)), but only a few chunks are in memory at the same time.
+
+    The chunks are written to a partial file, and after every chunk the number of persons written and the size of
+    the partial file are saved in a progress file, together with run_key (which should identify the input and
+    the options). With resume set, a previous run with the same run_key continues after its last complete chunk.
+    With progress set, the progress is also printed after every chunk.
+    """
+    file_name = export_file_name(compress)
+    partial_file_name, progress_file_name = file_name + '.partial', file_name + '.progress'
+    nr_of_persons = len(df_ancestors_total.index)
+    first_person, file_size = read_export_progress(progress_file_name, partial_file_name, run_key) if resume else (0, 0)
+    if first_person > 0:
+        print(f"Resuming after {first_person} of {nr_of_persons} persons")
+
+    # The number of alive persons born in the same place is determined for all persons at once (this is fast);
+    # every chunk gets the alive counts of the places of its persons, with the place codes renumbered accordingly
+    place_codes, alive_counts = count_alive_persons_per_birthplace(df_ancestors_total, start_year, nr_of_rows_per_person)
+    # Always at least 1 (possibly empty) chunk, to write the header
+    chunk_starts = range(first_person, max(nr_of_persons, 1), chunk_size) if first_person < nr_of_persons else []
+
+    def chunk_arguments():
+        for chunk_start in chunk_starts:
+            chunk_place_codes = place_codes[chunk_start:chunk_start + chunk_size]
+            yield (df_ancestors_total.iloc[chunk_start:chunk_start + chunk_size],
+                   np.where(chunk_place_codes >= 0, np.arange(len(chunk_place_codes)), -1),
+                   alive_counts[chunk_place_codes], start_year, nr_of_rows_per_person, chunk_start == 0, compress)
+
+    start_time = time.perf_counter()
+    with open(partial_file_name, 'r+b' if file_size > 0 else 'wb') as partial_file:
+        # Remove what was written after the last complete chunk of the previous run
+        partial_file.truncate(file_size)
+        partial_file.seek(file_size)
+        chunks = map_in_order(expand_chunk_to_csv, chunk_arguments(), nr_of_workers)
+        for chunk_start, chunk_csv in zip(chunk_starts, chunks):
+            partial_file.write(chunk_csv)
+            partial_file.flush()
+            nr_of_persons_written = min(chunk_start + chunk_size, nr_of_persons)
+            write_export_progress(progress_file_name, run_key, nr_of_persons_written, partial_file.tell())
+            if progress:
+                report_progress(nr_of_persons_written, nr_of_persons, start_time)
+    os.replace(partial_file_name, file_name)
+    os.remove(progress_file_name)
+
+
+def hash_rows(file_name, key_column):
+    """
+    Return a dict with for every row of a CSV file (by the value in key_column) a hash of its content. The rows
+    are hashed as text: the dtypes that read_csv infers can change for all rows by editing one row (e.g. a column
+    that is almost empty is read as float, until a text is filled in), which would change the hash of every row.
+    """
+    df = pd.read_csv(file_name, dtype=str, keep_default_na=False)
+    row_hashes = pd.util.hash_pandas_object(df, index=False)
+    return {str(key): format(row_hash, '016x') for key, row_hash in zip(df[key_column], row_hashes)}
+
+
+def create_manifest(df_ancestors_total, start_year, nr_of_rows_per_person, columns):
+    """
+    Create the manifest of a generated export file: the content hashes of the input rows, plus everything that
+    determines the layout of the export file
+    """
+    person_hashes = hash_rows(ANCESTORS_FILE_NAME, 'Persoon')
+    places_of_birth = [place if pd.notna(place) else None for place in df_ancestors_total['place_of_birth']]
+    return {'start_year': start_year, 'nr_of_rows_per_person': nr_of_rows_per_person, 'columns': list(columns),
+            'persons': [[str(person), person_hashes[str(person)], place_of_birth]
+                        for person, place_of_birth in zip(df_ancestors_total['Persoon'], places_of_birth)],
+            'cities': hash_rows(CITIES_FILE_NAME, 'name')}
+
+
+def read_manifest():
+    if not os.path.exists(MANIFEST_FILE_NAME):
+        return None
+    with open(MANIFEST_FILE_NAME) as manifest_file:
+        return json.load(manifest_file)
+
+
+def write_manifest(manifest):
+    with open(MANIFEST_FILE_NAME, 'w') as manifest_file:
+        json.dump(manifest, manifest_file)
+
+
+def determine_persons_to_regenerate(old_manifest, new_manifest):
+    """
+    Compare the manifest of the previous run with the new one and return the persons (as str) whose rows in the
+    export file have to be regenerated: changed or new persons, persons born or died in a changed city, and all
+    persons born in the same place as one of those (or as a removed person), as their number of alive persons
+    born in the same place may have changed.
+    """
+    old_persons = {person: (row_hash, place_of_birth) for person, row_hash, place_of_birth in old_manifest['persons']}
+    new_persons = {person: (row_hash, place_of_birth) for person, row_hash, place_of_birth in new_manifest['persons']}
+    old_cities, new_cities = old_manifest['cities'], new_manifest['cities']
+    changed_cities = {city for city in set(old_cities) | set(new_cities) if old_cities.get(city) != new_cities.get(city)}
+
+    changed_persons = {person for person, (row_hash, place_of_birth) in new_persons.items()
+                       if person not in old_persons or old_persons[person][0] != row_hash}
+    removed_persons = set(old_persons) - set(new_persons)
+    if changed_cities:
+        df_ancestors = pd.read_csv(ANCESTORS_FILE_NAME, usecols=['Persoon', 'place_of_birth', 'place_of_death'])
+        in_changed_city = df_ancestors['place_of_birth'].isin(changed_cities) | df_ancestors['place_of_death'].isin(changed_cities)
+        changed_persons |= set(df_ancestors.loc[in_changed_city, 'Persoon'].astype(str))
+
+    affected_places = {old_persons[person][1] for person in (changed_persons | removed_persons) if person in old_persons}
+    affected_places |= {new_persons[person][1] for person in changed_persons}
+    affected_places.discard(None)
+    return changed_persons | {person for person, (row_hash, place_of_birth) in new_persons.items()
+                              if place_of_birth in affected_places}
+
+
+def csv_block_offsets(csv_file, block_sizes):
+    """
+    Return the byte offsets of consecutive blocks of records in a CSV file (opened in binary mode), starting at the
+    current position; block_sizes holds the number of records of every block. The records are read with the csv
+    module, as a record isn't always one line: a quoted field (e.g. a remark) may contain line breaks.
+    """
+    line_ends = [csv_file.tell()]
+
+    def lines():
+        for line in iter(csv_file.readline, b''):
+            line_ends.append(csv_file.tell())
+            yield line.decode('utf-8')
+
+    # The csv reader only reads the lines of the record it returns, so after every record, the last line end is the
+    # end of the record
+    records = csv.reader(lines())
+    offsets = [line_ends[-1]]
+    for block_size in block_sizes:
+        for record in range(block_size):
+            next(records)
+        offsets.append(line_ends[-1])
+    return offsets
+
+
+def patch_export_file(old_manifest, new_manifest, df_regenerated_incl_years):
+    """
+    Write a new export file, with for every person either its rows from the previous export file or, if it was
+    regenerated, its rows from df_regenerated_incl_years
+    """
+    nr_of_rows_per_person = new_manifest['nr_of_rows_per_person']
+
+    # Determine where the rows of every person are in the previous export file (after the header)
+    old_persons = [person for person, row_hash, place_of_birth in old_manifest['persons']]
+    with open(EXPORT_FILE_NAME, 'rb') as old_file:
+        old_offsets = csv_block_offsets(old_file, [1] + [nr_of_rows_per_person] * len(old_persons))
+    header_end = old_offsets[1]
+    old_blocks = {person: (block_start, block_end)
+                  for person, block_start, block_end in zip(old_persons, old_offsets[1:-1], old_offsets[2:])}
+
+    # The rows of the regenerated persons, as text, per person
+    regenerated_csv = df_regenerated_incl_years.to_csv(index=None, header=False).encode('utf-8')
+    regenerated_persons = df_regenerated_incl_years['Persoon'].astype(str).to_numpy()[::nr_of_rows_per_person]
+    regenerated_offsets = csv_block_offsets(io.BytesIO(regenerated_csv), [nr_of_rows_per_person] * len(regenerated_persons))
+    regenerated_blocks = {person: regenerated_csv[block_start:block_end] for person, block_start, block_end
+                          in zip(regenerated_persons, regenerated_offsets[:-1], regenerated_offsets[1:])}
+
+    with open(EXPORT_FILE_NAME, 'rb') as old_file, open(EXPORT_FILE_NAME + '.tmp', 'wb') as new_file:
+        new_file.write(old_file.read(header_end))
+        for person, row_hash, place_of_birth in new_manifest['persons']:
+            if person in regenerated_blocks:
+                new_file.write(regenerated_blocks[person])
+            else:
+                block_start, block_end = old_blocks[person]
+                old_file.seek(block_start)
+                new_file.write(old_file.read(block_end - block_start))
+    os.replace(EXPORT_FILE_NAME + '.tmp', EXPORT_FILE_NAME)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the ancestor files that are used by main.py")
+    parser.add_argument('--incremental', action='store_true',
+                        help="only regenerate the persons that changed since the previous run")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="number of processes that expand the persons per year (default: 1)")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help=f"number of persons that are expanded per year at a time (default: {CHUNK_SIZE})")
+    parser.add_argument('--last-year', type=int, default=LAST_YEAR_OF_REFERENCE,
+                        help=f"last year in the export file (default: {LAST_YEAR_OF_REFERENCE})")
+    parser.add_argument('--gzip', action='store_true',
+                        help=f"write the export file compressed ({export_file_name(compress=True)}); not incremental")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue an interrupted run with the same input files and options")
+    args = parser.parse_args()
+    if args.workers < 1 or args.chunk_size < 1:
+        parser.error("--workers and --chunk-size must be at least 1")
+    generation_start_time = time.perf_counter()
+
+    # First read the data
+    df_ancestors, df_cities = read_input_files()
+    df_ancestors_total = merge_ancestors_and_cities(df_ancestors, df_cities)
+
+    # determine birth year of oldest ancestor, and the number of years (rows) per person
+    start_year = determine_start_year(df_ancestors_total)
+    current_year = date.today().year
+    if not start_year <= args.last_year <= current_year:
+        parser.error(f"--last-year must be between {start_year} (the first year of birth) and {current_year}")
+    nr_of_rows_per_person = (args.last_year + 1 - start_year)
+
+    write_interval_files(df_ancestors_total)
+    # The migration layer covers at least all years of the map
+    write_migration_file(df_ancestors_total, start_year, max(args.last_year, LAST_YEAR_OF_REFERENCE))
+
+    columns = list(df_ancestors_total.columns) + ["year_of_reference", "if_alive_nr_of_alive_persons_same_birthplace", "glyph_size"]
+    new_manifest = create_manifest(df_ancestors_total, start_year, nr_of_rows_per_person, columns)
+    old_manifest = read_manifest()
+
+    # An incremental run is only possible if the layout of the export file didn't change (e.g. due to a new
+    # oldest ancestor or new columns) and every person is only once in the ancestors file
+    incremental = (args.incremental and not args.gzip and old_manifest is not None and os.path.exists(EXPORT_FILE_NAME)
+                   and all(old_manifest[key] == new_manifest[key] for key in ['start_year', 'nr_of_rows_per_person', 'columns'])
+                   and df_ancestors['Persoon'].is_unique)
+    if incremental:
+        persons_to_regenerate = determine_persons_to_regenerate(old_manifest, new_manifest)
+        df_regenerate = df_ancestors_total[df_ancestors_total['Persoon'].astype(str).isin(persons_to_regenerate)]
+        df_regenerated_incl_years = expand_ancestors_per_year(df_regenerate, start_year, nr_of_rows_per_person)
+        patch_export_file(old_manifest, new_manifest, df_regenerated_incl_years)
+        print(f"Incremental update: regenerated {len(df_regenerate.index)} of {len(df_ancestors_total.index)} persons")
     else:
-        persons_glyph_size = 0
-    df_ancestors_incl_years.at[index, 'glyph_size'] = persons_glyph_size
+        # A run can only be resumed with the same input files and layout of the export file (see the manifest)
+        run_key = hashlib.sha1(json.dumps(new_manifest).encode('utf-8')).hexdigest()
+        write_export_file_in_chunks(df_ancestors_total, start_year, nr_of_rows_per_person, args.chunk_size, args.workers,
+                                    args.gzip, run_key, args.resume, progress=True)
+        print(f"Generated all {len(df_ancestors_total.index)} persons, from {start_year} to {args.last_year}")
+
+    # The manifest describes the uncompressed export file (for incremental runs), so is left as is on compressing
+    if not args.gzip:
+        write_manifest(new_manifest)
+    print(f"Done in {time.perf_counter() - generation_start_time:.2f} s")
 
 
-# Create csv file for new created dataframe
-exported_ancestor_list = df_ancestors_incl_years.to_csv ('exported_ancestor_list.csv', index = None, header=True)
+if __name__ == '__main__':
+    main()
@@ -1,27 +1,69 @@
-import pandas as pd
+import logging
+import os
+import sys
+import time
 import numpy as np
-from datetime import datetime, date
-from bokeh.io import output_file, curdoc
+from datetime import date
+from bokeh.events import RangesUpdate
+from bokeh.io import output_file, curdoc, save
 from bokeh.layouts import row, column
 from bokeh.plotting import figure, show, reset_output
-from bokeh.models import HoverTool, ColumnDataSource, CDSView, GroupFilter
+from bokeh.models import HoverTool, ColumnDataSource, CDSView, GroupFilter, IndexFilter, CustomJS
 from bokeh.models.widgets import Slider, Button, Div
 from bokeh.tile_providers import get_provider, Vendors
+from ancestor_data import get_shared_ancestors, cluster_cell_size_for_extent, cluster_extent, cluster_frame_data, \
+    get_shared_migrations, migration_frame_data, LAST_YEAR_OF_REFERENCE
 
 
 # Good tutorial: https://realpython.com/python-data-visualization-bokeh/#configuring-the-toolbar 
 
-# First read the data, as generated via Python script 'generate_ancestor_file.py'
+# Log at level info, also when the log level of the Bokeh server is set higher
+logger = logging.getLogger('ancestormap')
+logger.setLevel(logging.INFO)
+
+# Static build mode: 'python main.py --static' writes a standalone HTML file (ancestormap.html), in which the slider
+# and the play buttons run in the browser (via CustomJS) instead of on the Bokeh server. All per-year data is
+# written once into the file, so it can be served as a static page without any server round-trips.
+static_mode = __name__ == '__main__' and '--static' in sys.argv[1:]
+
+
+def resident_memory_mb():
+    # Current memory usage (resident set size) of this process in MB; only available on Linux
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except OSError:
+        return float('nan')
+
+
+# Measure the time and memory it takes to create the document of this session (logged at the end of this file)
+session_start_time = time.perf_counter()
+session_start_memory = resident_memory_mb()
+
+# First read the data, as generated via Python script 'generate_ancestor_file.py'. This is the compact file with one
+# row per person (instead of one row per person per year), see ancestor_data.py
+# The data is loaded and prepared only once per process (on starting the Bokeh server, see server_lifecycle.py), 
+# and shared by all sessions. So don't modify df_ancestors or year_index here!
 # df_ancestors = pd.read_csv('exported_ancestor_list.csv', sep=',', dtype={'place_of_birth': str, 'place_of_death': str})
-df_ancestors = pd.read_csv('exported_ancestor_list_short.csv', sep=',', dtype={'Persoon' : int, 'Achternaam' : str, 'Voornaam': str, 'Voorvoegsel' : str, 'date_of_birth' : object, 'place_of_birth' : str, 'date_of_death' : object, 'mothers_side' : object, 'mercator_x_birth' : object, 'mercator_y_birth' : object, 'mercator_x_death' : object, 'mercator_y_death' : object, 'year_of_birth' : int, 'year_of_death' : int, 'year_of_reference' : int, 'if_alive_nr_of_alive_persons_same_birthplace' : int, 'glyph_size' : int})
+shared_ancestors = get_shared_ancestors()
+df_ancestors = shared_ancestors.df_ancestors
 # df_ancestors.dtypes.to_csv('dtypes.csv')
 
-# Set date fields as date type fields
-df_ancestors['date_of_birth'] = pd.to_datetime(df_ancestors['date_of_birth'], format="%Y-%m-%d")
-df_ancestors['date_of_death'] = pd.to_datetime(df_ancestors['date_of_death'], format="%Y-%m-%d")
+# Determine the years to show in the slider:
+#   * start-year in slider is based on earliest date of birth of an ancestor
+#   * start-value in slider is 1800, but not before start-year in slider
+current_year = date.today().year
+start_year = shared_ancestors.start_year
+# if start_year < 1800:
+#     initial_year = 1800
+# else:
+#     initial_year = start_year
+initial_year = LAST_YEAR_OF_REFERENCE
 
-# Clean up dataframe, replacing all NaN values with an empty string
-df_ancestors = df_ancestors.replace(np.nan, '', regex=True)
+# Per year which persons were alive and their glyph sizes, so the slider can pick the rows of a year. And per zoom
+# level the clusters of persons born close to each other (see ancestor_data.py)
+year_index = shared_ancestors.year_index
+cluster_levels = shared_ancestors.cluster_levels
 
 
 # To be able to give the ancestors from mother's side a different color than those from my father's side,
@@ -37,10 +79,24 @@ df_ancestors = df_ancestors.replace(np.nan, '', regex=True)
 # glyphs, you are forced to use a ColumnDataSource otherwise the popup window will not be able to get the data.
 # In short, the ColumnDataSource is the core of Bokeh plots, that provides the data that is visualized by 
 # the glyphs of the plot.
-source = ColumnDataSource(df_ancestors)
-view_mother = CDSView(source=source, filters=[GroupFilter(column_name='mothers_side', group="Y")])
-view_father = CDSView(source=source, filters=[GroupFilter(column_name='mothers_side', group="N")])
-view_mother_and_father = CDSView(source=source, filters=[GroupFilter(column_name='mothers_side', group="X")])
+if static_mode:
+    # The source contains every person once (and only the columns that are used by the glyphs and the tooltip), 
+    # and is written to the HTML file only once. Which persons are shown in the selected year is determined by 
+    # year_filter, and on changing the year only the glyph sizes are changed (see show_year).
+    source_columns = ['Voornaam', 'Voorvoegsel', 'Achternaam', 'place_of_birth', 'date_of_birth', 'mothers_side', 
+                      'mercator_x_birth', 'mercator_y_birth']
+    source = ColumnDataSource(df_ancestors[source_columns].assign(glyph_size=0))
+    current_glyph_sizes = np.zeros(len(df_ancestors.index), dtype=int)
+    year_filter = IndexFilter(indices=[])
+    year_filters = [year_filter]
+else:
+    # On the Bokeh server, the source contains the clusters of persons of the selected year and zoom level, so only 
+    # one glyph per grid cell (and side) is sent to the browser (see show_clusters)
+    source = ColumnDataSource()
+    year_filters = []
+view_mother = CDSView(source=source, filters=[GroupFilter(column_name='mothers_side', group="Y")] + year_filters)
+view_father = CDSView(source=source, filters=[GroupFilter(column_name='mothers_side', group="N")] + year_filters)
+view_mother_and_father = CDSView(source=source, filters=[GroupFilter(column_name='mothers_side', group="X")] + year_filters)
 
 
 # Determine where the visualization will be rendered
@@ -67,18 +123,19 @@ map_plot.scatter('mercator_x_birth', 'mercator_y_birth', size='glyph_size', colo
 map_plot.scatter('mercator_x_birth', 'mercator_y_birth', size='glyph_size', color='#00BB27', hover_fill_color="red", 
     muted_alpha=0.2, source=source, view=view_mother_and_father)
 
-# Add time slider:
-#   * start-year in slider is based on earliest date of birth of an ancestor
-#   * start-value in slider is 1800, but not before start-year in slider
-current_year = date.today().year
-start_year = df_ancestors['date_of_birth'].min(skipna=True)
-start_year = datetime.strftime(start_year, '%Y%m%d')
-start_year = int(start_year[0:4])
-# if start_year < 1800:
-#     initial_year = 1800
-# else:
-#     initial_year = start_year
-initial_year = 1940
+# Add the optional migration layer: a line from place of birth to place of death of the alive persons (per route, 
+# with the number of persons as line width). It has its own source, which stays empty until the layer is turned on
+# in the legend, so viewers that don't use it don't receive any of its data (see show_migrations). As the data is 
+# only sent on request, this layer is only available on the Bokeh server.
+if not static_mode:
+    migration_source = ColumnDataSource(data={column_name: [] for column_name in [
+        'mercator_x_birth', 'mercator_y_birth', 'mercator_x_death', 'mercator_y_death', 'place_of_birth', 
+        'place_of_death', 'nr_of_persons', 'line_width']})
+    migration_renderer = map_plot.segment('mercator_x_birth', 'mercator_y_birth', 'mercator_x_death', 'mercator_y_death', 
+        line_width='line_width', color='#E08E0B', line_alpha=0.6, hover_line_color="red", 
+        legend_label="Migrations (birth → death)", source=migration_source, visible=False)
+
+# Add time slider
 time_slider = Slider(start=start_year, end=initial_year, value=initial_year, step=1, title="Year")
 
 
@@ -91,8 +148,48 @@ time_slider = Slider(start=start_year, end=initial_year, value=initial_year, ste
 # date_filter_birth_str = str(date_filter_birth_date)
 
 # data = df_ancestors[(df_ancestors['date_of_birth']<=date_filter_birth_str) & (df_ancestors['date_of_death']>=date_filter_death_str)]
-df_ancestors_specific_year = df_ancestors[(df_ancestors['if_alive_nr_of_alive_persons_same_birthplace']>0) & (df_ancestors['year_of_reference']==initial_year)]
-source.data = dict(df_ancestors_specific_year)
+def show_year(year):
+    # Static mode: take the persons alive in this year from the precomputed year_index. Update the indices of the 
+    # persons to show first (so the patch is not rendered with the filter of the previous year), and then only patch 
+    # the glyph sizes that changed
+    rows, glyph_sizes = year_index[year]
+    year_filter.indices = rows.tolist()
+    changed = glyph_sizes != current_glyph_sizes[rows]
+    if changed.any():
+        source.patch({'glyph_size': list(zip(rows[changed].tolist(), glyph_sizes[changed].tolist()))})
+        current_glyph_sizes[rows[changed]] = glyph_sizes[changed]
+
+
+# Zoom level of the clusters, based on the width and height of the map, and the extent of the map of which the 
+# clusters are shown: the visible part of the map plus a margin (see ancestor_data.py)
+cluster_cell_size = cluster_cell_size_for_extent(x_range[1] - x_range[0], y_range[1] - y_range[0])
+shown_cluster_extent = cluster_extent(*x_range, *y_range)
+
+
+def show_clusters(year):
+    # Bokeh server: show the clusters of this year at the current zoom level, within the shown extent of the map. The 
+    # data of the clusters is precomputed per year and zoom level (and shared by all sessions, so don't modify it). 
+    # If the number of clusters didn't change, only the columns that changed are sent to the browser (e.g. only the 
+    # glyph sizes)
+    frame_data = cluster_frame_data(cluster_levels[cluster_cell_size], year, shown_cluster_extent)
+    if source.data and len(source.data['glyph_size']) == len(frame_data['glyph_size']):
+        changed_columns = {column_name: column_values for column_name, column_values in frame_data.items() 
+                           if column_values != source.data[column_name]}
+        if changed_columns:
+            source.data.update(changed_columns)
+    else:
+        source.data = frame_data
+
+
+def show_migrations(year):
+    # Bokeh server: show the migrations of this year; the migration index is loaded on first use (see ancestor_data.py)
+    migration_source.data = migration_frame_data(get_shared_migrations(), year)
+
+
+if static_mode:
+    show_year(initial_year)
+else:
+    show_clusters(initial_year)
 
 
 # Define callback function, that will be called on changing the time slider
@@ -112,14 +209,44 @@ def callback(attr, old, new):
     # data = df_ancestors[(df_ancestors['date_of_birth']<=date_filter_birth_str) & (df_ancestors['date_of_death']>=date_filter_death_str)]
     # data = df_ancestors[df_ancestors['mothers_side'] == "Y"]
 
-    df_ancestors_specific_year = df_ancestors[(df_ancestors['if_alive_nr_of_alive_persons_same_birthplace']>0) & (df_ancestors['year_of_reference']==new)]
-    source.data = dict(df_ancestors_specific_year)
+    show_clusters(new)
+    if migration_renderer.visible:
+        show_migrations(new)
 
     # source.data = ColumnDataSource(data=data).data
 
 
-# Call function Callback on changing the slider
-time_slider.on_change('value', callback)
+# Define callback function, that will be called once after zooming or panning the map (with the new x and y ranges
+# in the event): switch to the clusters of the new zoom level, or to the clusters around the visible part of the map 
+# if it is no longer within the shown extent
+def ranges_callback(event):
+    global cluster_cell_size, shown_cluster_extent
+    x_start, x_end = (event.x0, event.x1) if event.x0 is not None else (map_plot.x_range.start, map_plot.x_range.end)
+    y_start, y_end = (event.y0, event.y1) if event.y0 is not None else (map_plot.y_range.start, map_plot.y_range.end)
+    new_cluster_cell_size = cluster_cell_size_for_extent(abs(x_end - x_start), abs(y_end - y_start))
+    extent_x_start, extent_x_end, extent_y_start, extent_y_end = shown_cluster_extent
+    visible = (extent_x_start <= min(x_start, x_end) and max(x_start, x_end) <= extent_x_end and 
+               extent_y_start <= min(y_start, y_end) and max(y_start, y_end) <= extent_y_end)
+    if new_cluster_cell_size != cluster_cell_size or not visible:
+        cluster_cell_size = new_cluster_cell_size
+        shown_cluster_extent = cluster_extent(x_start, x_end, y_start, y_end)
+        show_clusters(time_slider.value)
+
+
+# Define callback function, that will be called on turning the migration layer on or off in the legend. When turned 
+# off, the data is removed again, so it isn't sent with every change of the slider
+def migration_callback(attr, old, new):
+    if new:
+        show_migrations(time_slider.value)
+    else:
+        migration_source.data = {column_name: [] for column_name in migration_source.data}
+
+
+# Call function Callback on changing the slider (in static mode, the slider is handled in the browser; see below)
+if not static_mode:
+    time_slider.on_change('value', callback)
+    map_plot.on_event(RangesUpdate, ranges_callback)
+    migration_renderer.on_change('visible', migration_callback)
 
 
 # Add play button
@@ -164,10 +291,54 @@ def animateback():
 
 
 button = Button(label='► Play forwards', width=60)
-button.on_click(animate) 
-
 button2 = Button(label='► Play backwards', width=60)
-button2.on_click(animateback) 
+
+if not static_mode:
+    button.on_click(animate) 
+    button2.on_click(animateback) 
+else:
+    # Same as function show_year, but in the browser. The rows and glyph sizes of all years are written once 
+    # into the HTML file
+    year_frames = {str(year): {'rows': rows.tolist(), 'glyph_sizes': glyph_sizes.tolist()} 
+                   for year, (rows, glyph_sizes) in year_index.items()}
+    time_slider.js_on_change('value', CustomJS(args=dict(source=source, year_filter=year_filter, 
+                                                         year_frames=year_frames), code="""
+        const frame = year_frames[String(cb_obj.value)]
+        const glyph_size = Array.from(source.data['glyph_size'])
+        for (let i = 0; i < frame.rows.length; i++) {
+            glyph_size[frame.rows[i]] = frame.glyph_sizes[i]
+        }
+        // The view only recomputes which persons to show on a change of the source, not on a change of the filter,
+        // so first set the persons of this year in the filter and then change the source
+        year_filter.indices = frame.rows
+        source.data = Object.assign({}, source.data, {glyph_size: glyph_size})
+    """))
+
+    # Same as functions animate and animateback (including animate_update and animate_update_back), but in the
+    # browser using a timer instead of a periodic callback
+    animate_code = """
+        if (button.label == play_label && other_button.label == other_play_label) {
+            button.label = pause_label
+            window.ancestormap_timer = setInterval(function() {
+                let year = time_slider.value + step
+                if (year > time_slider.end) {
+                    year = time_slider.start
+                } else if (year < time_slider.start) {
+                    year = time_slider.end
+                }
+                time_slider.value = year
+            }, 200)
+        } else {
+            button.label = play_label
+            clearInterval(window.ancestormap_timer)
+        }
+    """
+    button.js_on_event('button_click', CustomJS(args=dict(button=button, other_button=button2, time_slider=time_slider, 
+        step=1, play_label='► Play forwards', pause_label='❚❚ Pause forwards', other_play_label='► Play backwards'), 
+        code=animate_code))
+    button2.js_on_event('button_click', CustomJS(args=dict(button=button2, other_button=button, time_slider=time_slider, 
+        step=-1, play_label='► Play backwards', pause_label='❚❚ Pause backwards', other_play_label='► Play forwards'), 
+        code=animate_code))
 
 div = Div(text="""This page plots the ancestors and their places of birth for family van Drunen. <br><br>
 <i>© Adri van Drunen, 2019-2023</i><br><br><br>""")
@@ -182,17 +353,30 @@ map_plot.legend.location = 'top_left'
 map_plot.legend.click_policy = 'hide'
 
 # Format the tooltip
-tooltips = [
-            ('Name','@Voornaam @Voorvoegsel @Achternaam'),
-            ('Place of birth','@place_of_birth'),
-            ('Date of birth','@date_of_birth{%F}'),
-           ]
-
-# Add the HoverTool to the figure
-map_plot.add_tools(HoverTool(tooltips=tooltips, formatters={
+if static_mode:
+    tooltips = [
+                ('Name','@Voornaam @Voorvoegsel @Achternaam'),
+                ('Place of birth','@place_of_birth'),
+                ('Date of birth','@date_of_birth{%F}'),
+               ]
+else:
+    tooltips = [
+                ('Name','@names'),
+                ('Place of birth','@place_of_birth'),
+                ('Number of persons','@nr_of_persons'),
+               ]
+
+# Add the HoverTool to the figure (only for the ancestors; the migration layer has its own tooltip)
+ancestor_renderers = [renderer for renderer in map_plot.renderers if getattr(renderer, 'data_source', None) is source]
+map_plot.add_tools(HoverTool(renderers=ancestor_renderers, tooltips=tooltips, formatters={
         '@date_of_birth': 'datetime', # use 'datetime' formatter for 'Date of birth' field
     })
 )
+if not static_mode:
+    map_plot.add_tools(HoverTool(renderers=[migration_renderer], tooltips=[
+                ('Migration','@place_of_birth → @place_of_death'),
+                ('Number of persons','@nr_of_persons'),
+               ]))
 
 
 # Organize the layout
@@ -205,10 +389,21 @@ layout = row(
 # Use reset_output() between subsequent show() calls, as needed
 reset_output()
 
-# Preview  
-show(map_plot)  
+# Preview (in static mode, the complete page is saved below instead)
+if not static_mode:
+    show(map_plot)  
 
 curdoc().title = "Birth places of my Ancestors"
 # curdoc().add_root(map_plot)
 curdoc().add_root(layout)
 
+if static_mode:
+    # Write the complete page (map, slider and play buttons) as standalone HTML file
+    output_file('ancestormap.html', title="Birth places of my Ancestors")
+    save(layout)
+
+session_end_memory = resident_memory_mb()
+logger.info("Session document created in %.1f ms; memory before %.1f MB, after %.1f MB (+%.1f MB)",
+            (time.perf_counter() - session_start_time) * 1000, session_start_memory, session_end_memory,
+            session_end_memory - session_start_memory)
+
@@ -0,0 +1,24 @@
+import logging
+import time
+from ancestor_data import get_shared_ancestors
+
+
+"""
+Server lifecycle hooks of the Bokeh server. These are used when the app directory is served 
+('bokeh serve .' instead of 'bokeh serve main.py', see Procfile).
+
+On starting the server, the ancestor data is loaded and prepared once, so every session (every run of main.py)
+can use the shared data instead of reading and preparing the CSV file again.
+"""
+
+
+# Log at level info, also when the log level of the Bokeh server is set higher
+logger = logging.getLogger('ancestormap')
+logger.setLevel(logging.INFO)
+
+
+def on_server_loaded(server_context):
+    start_time = time.perf_counter()
+    shared_ancestors = get_shared_ancestors()
+    logger.info("Loaded %d ancestors (%d-%d) in %.1f ms", len(shared_ancestors.df_ancestors.index),
+                shared_ancestors.start_year, shared_ancestors.last_year, (time.perf_counter() - start_time) * 1000)
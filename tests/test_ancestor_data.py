@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import ancestor_data
+
+
+"""
+Tests of the functions in 'ancestor_data.py' that prepare the ancestors for the map
+"""
+
+
+def test_cluster_glyph_sizes():
+    nr_of_persons = np.arange(1, 10001)
+    glyph_sizes = ancestor_data.cluster_glyph_sizes(nr_of_persons)
+
+    # Small clusters have the same size as the persons themselves, larger ones grow but never beyond the maximum
+    small = nr_of_persons <= ancestor_data.CLUSTER_LINEAR_GLYPH_PERSONS
+    assert (glyph_sizes[small] == nr_of_persons[small] + 5).all()
+    assert (np.diff(glyph_sizes) >= 0).all()
+    assert glyph_sizes.max() == ancestor_data.CLUSTER_MAX_GLYPH_SIZE
+
+
+def test_cluster_frame_data_within_extent():
+    # Persons born in 3 places, 100 km apart (so in different cells at the lowest zoom levels)
+    df_intervals = pd.DataFrame({
+        'Voornaam': ['Anna', 'Jan', 'Piet'], 'Voorvoegsel': '', 'Achternaam': 'Jansen',
+        'place_of_birth': ['Breda', 'Tilburg', 'Eindhoven'], 'mothers_side': 'Y',
+        'mercator_x_birth': [500000.0, 600000.0, 700000.0], 'mercator_y_birth': 6800000.0,
+        'year_of_birth': 1800, 'year_of_death': 1850})
+    year_index = ancestor_data.build_year_index(df_intervals, 1800, 1800)
+    cluster_level = ancestor_data.build_cluster_level(df_intervals, year_index, 1000)
+
+    # The extent of a map of 20 km around Tilburg only includes Tilburg, that of 100 km includes all places
+    extent = ancestor_data.cluster_extent(590000, 610000, 6790000, 6810000)
+    assert ancestor_data.cluster_frame_data(cluster_level, 1800, extent)['place_of_birth'] == ['Tilburg']
+    extent = ancestor_data.cluster_extent(550000, 650000, 6750000, 6850000)
+    assert ancestor_data.cluster_frame_data(cluster_level, 1800, extent) is cluster_level.frames[1800]
+
+    # The larger of the width and height of the map determines the zoom level
+    assert ancestor_data.cluster_cell_size_for_extent(60000, 600000) == 8000
+    assert ancestor_data.cluster_cell_size_for_extent(600000, 60000) == 8000
+
+
+def test_binary_intervals_with_many_places(tmp_path):
+    # More places than fit in int16 codes
+    nr_of_persons = 40000
+    df_intervals = pd.DataFrame({
+        'Persoon': np.arange(nr_of_persons), 'Achternaam': 'van Drunen', 'Voornaam': 'Adriaan', 'Voorvoegsel': '',
+        'date_of_birth': ancestor_data.to_dates(pd.Series(['1800-01-01'] * nr_of_persons)),
+        'place_of_birth': [f'Place {person}' for person in range(nr_of_persons)],
+        'date_of_death': ancestor_data.to_dates(pd.Series(['1850-12-31'] * nr_of_persons)),
+        'place_of_death': [f'Place {person % 7}' for person in range(nr_of_persons)], 'mothers_side': 'N',
+        'mercator_x_birth': 500000.0, 'mercator_y_birth': 6800000.0, 'mercator_x_death': 500000.0,
+        'mercator_y_death': 6800000.0, 'year_of_birth': 1800, 'year_of_death': 1850})
+    binary_file = tmp_path / 'intervals.npz'
+    ancestor_data.save_ancestor_intervals_binary(df_intervals, binary_file)
+    df_read = ancestor_data.read_ancestor_intervals_binary(binary_file)
+    assert df_read['place_of_birth'].tolist() == df_intervals['place_of_birth'].tolist()
+    assert df_read['place_of_death'].tolist() == df_intervals['place_of_death'].tolist()
+    # Same dtypes as when the CSV file is read (see load_ancestor_intervals)
+    assert isinstance(df_read['place_of_birth'].dtype, pd.CategoricalDtype)
+    assert len(df_read['place_of_death'].cat.categories) == 7
+    assert df_read['mercator_x_birth'].dtype == np.float64
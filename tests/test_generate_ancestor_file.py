@@ -0,0 +1,141 @@
+import gzip
+import hashlib
+import os
+import shutil
+import sys
+import pytest
+import generate_ancestor_file
+
+
+"""
+Tests of 'generate_ancestor_file.py'. The generator is run on a copy of the input files of the repository in a
+temporary directory, and the generated export file is compared with the output of the original implementation.
+"""
+
+
+REPOSITORY_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# SHA-256 of 'exported_ancestor_list.csv' as generated from the input files of the repository by the original
+# implementation (that determined the number of alive persons row by row), with line endings as '\n'
+EXPORT_FILE_SHA256 = '9e377772dde48177a2ab1e9985cc34f6ea4c2fc06d7ad025fd66195047cee0f8'
+
+
+@pytest.fixture
+def generation_directory(tmp_path, monkeypatch):
+    """
+    Temporary working directory with a copy of the input files
+    """
+    for file_name in [generate_ancestor_file.ANCESTORS_FILE_NAME, generate_ancestor_file.CITIES_FILE_NAME]:
+        shutil.copy(os.path.join(REPOSITORY_DIRECTORY, file_name), tmp_path)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def run_generator(monkeypatch, *options):
+    monkeypatch.setattr(sys, 'argv', ['generate_ancestor_file.py', *options])
+    generate_ancestor_file.main()
+
+
+def export_file_sha256(file_name=generate_ancestor_file.EXPORT_FILE_NAME):
+    with open(file_name, 'rb') as export_file:
+        return hashlib.sha256(export_file.read().replace(b'\r\n', b'\n')).hexdigest()
+
+
+def test_export_file_is_unchanged(generation_directory, monkeypatch):
+    run_generator(monkeypatch)
+    assert export_file_sha256() == EXPORT_FILE_SHA256
+
+
+@pytest.mark.parametrize('options', [
+    # Several worker processes, with chunks that don't divide the number of persons (157)
+    ['--workers', '2', '--chunk-size', '7'],
+    # A chunk per person
+    ['--chunk-size', '1'],
+    # A single chunk with all persons
+    ['--workers', '2', '--chunk-size', '1000'],
+])
+def test_export_file_is_same_for_workers_and_chunk_sizes(generation_directory, monkeypatch, options):
+    run_generator(monkeypatch, *options)
+    assert export_file_sha256() == EXPORT_FILE_SHA256
+
+
+def test_interrupted_run_is_resumed(generation_directory, monkeypatch, capsys):
+    # Interrupt the run after 3 chunks have been expanded
+    expand_chunk_to_csv = generate_ancestor_file.expand_chunk_to_csv
+    nr_of_chunks = 0
+
+    def interrupted_expand_chunk_to_csv(*arguments):
+        nonlocal nr_of_chunks
+        nr_of_chunks += 1
+        if nr_of_chunks > 3:
+            raise RuntimeError("interrupted")
+        return expand_chunk_to_csv(*arguments)
+
+    monkeypatch.setattr(generate_ancestor_file, 'expand_chunk_to_csv', interrupted_expand_chunk_to_csv)
+    with pytest.raises(RuntimeError, match="interrupted"):
+        run_generator(monkeypatch, '--chunk-size', '7')
+    assert not os.path.exists(generate_ancestor_file.EXPORT_FILE_NAME)
+
+    monkeypatch.setattr(generate_ancestor_file, 'expand_chunk_to_csv', expand_chunk_to_csv)
+    capsys.readouterr()
+    run_generator(monkeypatch, '--chunk-size', '7', '--resume')
+    assert "Resuming after 21 of 157 persons" in capsys.readouterr().out
+    assert export_file_sha256() == EXPORT_FILE_SHA256
+    assert not os.path.exists(generate_ancestor_file.EXPORT_FILE_NAME + '.partial')
+    assert not os.path.exists(generate_ancestor_file.EXPORT_FILE_NAME + '.progress')
+
+
+def test_compressed_export_file_is_unchanged(generation_directory, monkeypatch):
+    run_generator(monkeypatch, '--gzip', '--chunk-size', '7')
+    with open(generate_ancestor_file.export_file_name(compress=True), 'rb') as export_file:
+        export_file_content = gzip.decompress(export_file.read())
+    assert hashlib.sha256(export_file_content.replace(b'\r\n', b'\n')).hexdigest() == EXPORT_FILE_SHA256
+
+
+def edit_input_file(file_name, old_text, new_text):
+    with open(file_name, newline='') as input_file:
+        text = input_file.read()
+    assert old_text in text
+    with open(file_name, 'w', newline='') as input_file:
+        input_file.write(text.replace(old_text, new_text, 1))
+
+
+# Remark of Persoon 36 (born in Oosterhout) with a line break, so one of its records spans two lines
+REMARK_WITH_LINE_BREAK = ('maps_ancestors.csv', '1841-12-26,Oosterhout,,,,,,Y',
+                          '1841-12-26,Oosterhout,,,,,"first line\nsecond line",Y')
+
+
+@pytest.mark.parametrize('initial_edits, edit', [
+    # Person without a place of birth
+    ([], ('maps_ancestors.csv', '\n35,,,', '\n35,,Anna,')),
+    # City of which the only person has no place of birth (it is the place of death of Persoon 109)
+    ([], ('maps_cities.csv', 'Amsterdam,52.366667,4.9,545933,6864513', 'Amsterdam,52.366667,4.9,545933,6864600')),
+    # Person that died later, so the number of alive persons born in Oosterhout changes
+    ([], ('maps_ancestors.csv', '1751-01-01,Oosterhout,,,,,1841-12-26', '1751-01-01,Oosterhout,,,,,1851-12-26')),
+    # Person that was born in another place
+    ([], ('maps_ancestors.csv', '1789-11-21,Boekel', '1789-11-21,Oosterhout')),
+    # Same, with a line break in a field of the export file (of a regenerated person, and before copied persons)
+    ([REMARK_WITH_LINE_BREAK], ('maps_ancestors.csv', '1789-11-21,Boekel', '1789-11-21,Oosterhout')),
+])
+def test_incremental_run_is_same_as_complete_run(generation_directory, monkeypatch, initial_edits, edit):
+    for file_name, old_text, new_text in initial_edits:
+        edit_input_file(file_name, old_text, new_text)
+    run_generator(monkeypatch)
+    edit_input_file(*edit)
+    run_generator(monkeypatch, '--incremental')
+    incremental_sha256 = export_file_sha256()
+
+    os.remove(generate_ancestor_file.MANIFEST_FILE_NAME)
+    run_generator(monkeypatch)
+    assert incremental_sha256 == export_file_sha256()
+
+
+def test_incremental_run_only_regenerates_changed_persons(generation_directory, monkeypatch, capsys):
+    run_generator(monkeypatch)
+    # Opmerking is empty for all persons (so read as float) until a text is filled in
+    edit_input_file('maps_ancestors.csv', '1751-01-01,Oosterhout,,,,,1841-12-26,Oosterhout,,,,,',
+                    '1751-01-01,Oosterhout,,,,,1841-12-26,Oosterhout,,,,,Remark')
+    capsys.readouterr()
+    run_generator(monkeypatch, '--incremental')
+    # Only Persoon 36 and the other persons born in Oosterhout
+    assert "regenerated 26 of 157 persons" in capsys.readouterr().out